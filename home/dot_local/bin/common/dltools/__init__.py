@@ -0,0 +1,6 @@
+"""
+Shared engine of dl-jadx, dl-jeb and dl-tools
+
+The scripts next to this package are thin front-ends: they add their
+directory to sys.path and import from here.
+"""
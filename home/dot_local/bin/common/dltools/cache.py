@@ -0,0 +1,336 @@
+"""
+Artifact and metadata caches shared by the download tools
+"""
+
+import os
+import json
+import time
+import shutil
+import socket
+import hashlib
+import threading
+from pathlib import Path
+from urllib.request import Request
+from urllib.error import URLError, HTTPError
+
+from .httppool import urlopen
+
+
+# Default size cap of the artifact cache, in MB
+DEFAULT_CACHE_MAX_SIZE = 2048
+
+# Tools running in parallel threads share the cache files below
+_stats_lock = threading.Lock()
+_metadata_locks = {}
+_metadata_locks_guard = threading.Lock()
+
+
+def get_temp_suffix():
+    """Get a suffix for temporary files that is unique per process and thread"""
+    return f"{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def get_cache_dir():
+    """Get the download cache directory shared by all download tools"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "dl-tools"
+
+
+def get_artifact_path(cache_key):
+    """Get the path of an artifact in the content-addressed cache"""
+    return get_cache_dir() / "artifacts" / cache_key
+
+
+def get_metadata_cache_paths(url):
+    """Get the sidecar and body paths of a cached metadata response"""
+    return get_metadata_cache_paths_by_key(hashlib.sha256(url.encode("utf-8")).hexdigest()[:32])
+
+
+def get_metadata_cache_paths_by_key(key):
+    """Get the sidecar and body paths of a cached metadata response from the hash of its URL"""
+    metadata_dir = get_cache_dir() / "metadata"
+    return metadata_dir / f"{key}.json", metadata_dir / f"{key}.body"
+
+
+def load_cached_metadata(url, load_body=True):
+    """
+    Load a cached metadata response.
+
+    Returns:
+        Tuple (sidecar dict, body bytes), or (None, None) if nothing is
+        cached; the body is None when load_body is False
+    """
+    meta_path, body_path = get_metadata_cache_paths(url)
+    try:
+        meta = json.loads(meta_path.read_text())
+        if meta.get("url") != url or not body_path.exists():
+            return None, None
+        return meta, body_path.read_bytes() if load_body else None
+    except Exception:
+        return None, None
+
+
+def save_cached_metadata(url, meta):
+    """Write the sidecar of a cached metadata response"""
+    meta_path, _ = get_metadata_cache_paths(url)
+    try:
+        meta_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_meta = meta_path.with_name(f"{meta_path.name}.{get_temp_suffix()}")
+        tmp_meta.write_text(json.dumps(meta))
+        os.replace(tmp_meta, meta_path)
+    except Exception as e:
+        print(f"Warning: Could not cache metadata: {e}")
+
+
+def refresh_metadata(url, headers, ttl=0):
+    """
+    Bring the cached copy of a metadata document up to date.
+
+    A cached copy younger than ttl seconds is used without any request.
+    Otherwise the request carries If-None-Match / If-Modified-Since and a
+    304 answer keeps the cached body. If the server can't be reached at
+    all, a stale cached copy is used as a last resort.
+
+    Returns:
+        The sidecar dict of the cached copy; its "digest" identifies the
+        body, which is stored next to it on disk
+    """
+    with _metadata_locks_guard:
+        lock = _metadata_locks.setdefault(url, threading.Lock())
+    with lock:
+        return _refresh_metadata(url, headers, ttl)
+
+
+def _refresh_metadata(url, headers, ttl):
+    meta, _ = load_cached_metadata(url, load_body=False)
+
+    # The body was negotiated for the Accept-Encoding it was requested with;
+    # when the decoders at hand changed since, fetch it again unconditionally
+    renegotiate = meta is not None and meta.get("accept_encoding") != headers.get("Accept-Encoding")
+
+    if meta is not None and not renegotiate:
+        age = time.time() - meta.get("fetched_at", 0)
+        if ttl > 0 and age < ttl:
+            print(f"Using cached {url} ({age:.0f}s old)")
+            return meta
+
+        headers = dict(headers)
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        with urlopen(Request(url, headers=headers)) as response:
+            # Stream the body to disk so large documents are never held in memory
+            _, body_path = get_metadata_cache_paths(url)
+            body_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_body = body_path.with_name(f"{body_path.name}.{get_temp_suffix()}")
+            body_sha256 = hashlib.sha256()
+            with open(tmp_body, "wb") as f:
+                for chunk in iter(lambda: response.read(65536), b""):
+                    f.write(chunk)
+                    body_sha256.update(chunk)
+            os.replace(tmp_body, body_path)
+
+            meta = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "accept_encoding": headers.get("Accept-Encoding"),
+                "content_encoding": response.headers.get("Content-Encoding"),
+                "digest": body_sha256.hexdigest(),
+                "fetched_at": time.time(),
+            }
+            save_cached_metadata(url, meta)
+            return meta
+    except HTTPError as e:
+        if e.code != 304 or meta is None:
+            raise
+        print(f"Not modified, using cached {url}")
+        meta["fetched_at"] = time.time()
+        save_cached_metadata(url, meta)
+        return meta
+    except (URLError, socket.timeout) as e:
+        if meta is None:
+            raise
+        print(f"Warning: {getattr(e, 'reason', e)}, using cached {url} from {time.ctime(meta.get('fetched_at', 0))}")
+        return meta
+
+
+def fetch_metadata(url, headers, ttl=0, use_cache=True):
+    """
+    Fetch a metadata document through the conditional-request cache.
+
+    Returns:
+        Response body as bytes
+    """
+    if not use_cache:
+        with urlopen(Request(url, headers=headers)) as response:
+            return response.read()
+
+    refresh_metadata(url, headers, ttl)
+    _, body = load_cached_metadata(url)
+    if body is None:
+        raise Exception(f"Cached copy of {url} disappeared")
+    return body
+
+
+def update_cache_stats(**counters):
+    """Add to the hit/miss counters kept next to the artifacts"""
+    stats_path = get_cache_dir() / "stats.json"
+    with _stats_lock:
+        try:
+            stats = json.loads(stats_path.read_text()) if stats_path.exists() else {}
+            for name, value in counters.items():
+                stats[name] = stats.get(name, 0) + value
+            tmp_path = stats_path.with_name(f"stats.json.{get_temp_suffix()}")
+            tmp_path.write_text(json.dumps(stats))
+            os.replace(tmp_path, stats_path)
+        except Exception:
+            pass
+
+
+def print_cache_stats():
+    """Print the size of the artifact cache and its hit/miss counters"""
+    artifacts_dir = get_cache_dir() / "artifacts"
+    entries = [p for p in artifacts_dir.iterdir() if p.is_file()] if artifacts_dir.exists() else []
+    total_size = sum(p.stat().st_size for p in entries)
+
+    stats_path = get_cache_dir() / "stats.json"
+    try:
+        stats = json.loads(stats_path.read_text()) if stats_path.exists() else {}
+    except Exception:
+        stats = {}
+
+    print(f"Artifact cache: {artifacts_dir}")
+    print(f"  Entries: {len(entries)} ({total_size / 1024 / 1024:.2f} MB)")
+    print(f"  Hits:    {stats.get('hits', 0)} ({stats.get('bytes_saved', 0) / 1024 / 1024:.2f} MB not downloaded)")
+    print(f"  Misses:  {stats.get('misses', 0)}")
+
+
+def cache_lookup(cache_key):
+    """
+    Look up an artifact in the cache.
+
+    Returns:
+        Path of the cached artifact, or None on a miss
+    """
+    cached_path = get_artifact_path(cache_key)
+    if not cached_path.is_file():
+        print(f"Cache miss: {cache_key}")
+        update_cache_stats(misses=1)
+        return None
+
+    # The modification time doubles as the LRU timestamp
+    try:
+        os.utime(cached_path)
+    except OSError:
+        pass
+    print(f"Cache hit: {cached_path}")
+    update_cache_stats(hits=1, bytes_saved=cached_path.stat().st_size)
+    return cached_path
+
+
+def cache_discard(cache_key):
+    """Remove an artifact that failed verification from the cache"""
+    try:
+        get_artifact_path(cache_key).unlink()
+    except OSError:
+        pass
+
+
+def cache_store(src_path, cache_key, max_size, move=False):
+    """
+    Add a verified artifact to the cache and evict least recently used entries.
+
+    Args:
+        src_path: Path object of the verified file
+        cache_key: Content key ("sha256-<hex>" or "url-<hex>")
+        max_size: Cache size cap in bytes
+        move: Move src_path into the cache instead of copying it
+
+    Returns:
+        Path of the cached artifact, or None if it could not be stored
+    """
+    cached_path = get_artifact_path(cache_key)
+    tmp_path = cached_path.with_name(f".{cache_key}.{get_temp_suffix()}")
+    try:
+        cached_path.parent.mkdir(parents=True, exist_ok=True)
+        if move:
+            # Falls back to copy + delete across file systems
+            shutil.move(str(src_path), str(tmp_path))
+        else:
+            shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, cached_path)
+    except Exception as e:
+        print(f"Warning: Could not add {src_path.name} to the cache: {e}")
+        if tmp_path.exists():
+            tmp_path.unlink()
+        return None
+
+    print(f"Cached as {cache_key}")
+    evict_cache(max_size, keep=cached_path)
+    return cached_path
+
+
+def evict_cache(max_size, keep=None):
+    """Remove least recently used artifacts until the cache fits in max_size bytes"""
+    artifacts_dir = get_cache_dir() / "artifacts"
+    entries = []
+    for path in artifacts_dir.iterdir():
+        try:
+            if path.is_file() and not path.name.startswith("."):
+                st = path.stat()
+                entries.append((st.st_mtime, st.st_size, path))
+        except OSError:
+            # Removed by a concurrent run
+            continue
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        if path == keep:
+            continue
+        try:
+            path.unlink()
+            total_size -= size
+            print(f"Evicted from cache: {path.name}")
+        except OSError:
+            pass
+
+
+def get_cache_key(file_url, file_size, modified_time):
+    """
+    Get the artifact cache key of a file that comes without a digest.
+
+    52pojie's list.js carries no digest, so URL, size and modification time
+    identify the content instead.
+    """
+    identity = f"{file_url}\n{file_size}\n{modified_time}"
+    return "url-" + hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+def copy_from_cache(cached_path, output_path, expected_size):
+    """Copy a cached artifact to the target directory"""
+    actual_size = cached_path.stat().st_size
+    if expected_size > 0 and actual_size != expected_size:
+        print(
+            f"Cached file size mismatch! Expected {expected_size} bytes, but file is {actual_size} bytes"
+        )
+        return False
+
+    # Not "<name>.part": that is a resumable partial download of the same file
+    tmp_path = output_path.with_name(f".{output_path.name}.{get_temp_suffix()}")
+    try:
+        shutil.copyfile(cached_path, tmp_path)
+        os.replace(tmp_path, output_path)
+    except Exception as e:
+        print(f"Error copying from cache: {e}")
+        if tmp_path.exists():
+            tmp_path.unlink()
+        return False
+
+    print(f"Copied from cache: {output_path}")
+    return True
@@ -0,0 +1,171 @@
+"""
+Cached "is this tool up to date?" check, fast enough for shell startup
+
+This module only imports os, sys and time: the check has to answer in
+well under 50ms, and argparse, pathlib, json, hashlib or zipfile alone
+would each add a noticeable share of that. The rest of dltools is never
+imported on this path.
+
+The latest known release of a tool is kept in a one-line state file,
+${XDG_CACHE_HOME:-~/.cache}/dl-tools/check/<tool>, holding
+"<tag> <unix time of the lookup>". Every normal run rewrites it; a check
+that finds it older than its TTL starts a detached background refresh
+and answers from the stale copy.
+"""
+
+import os
+import sys
+import time
+
+
+# Exit codes of --check
+EXIT_UP_TO_DATE = 0
+EXIT_UPDATE_AVAILABLE = 10
+EXIT_UNKNOWN = 11
+
+# Default age in seconds after which the state file is refreshed
+DEFAULT_CHECK_TTL = 6 * 3600
+
+# A refresh that hasn't finished after this many seconds is considered dead
+REFRESH_LOCK_TIMEOUT = 120
+
+
+def get_check_dir():
+    """Same location as dltools.cache.get_cache_dir(), without importing pathlib"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "dl-tools", "check")
+
+
+def read_check_state(tool_name):
+    """
+    Read the latest known release of a tool.
+
+    Returns:
+        Tuple (tag, fetched_at), or (None, 0) if nothing is recorded
+    """
+    try:
+        with open(os.path.join(get_check_dir(), tool_name)) as f:
+            tag, fetched_at = f.read().split()
+        return tag, float(fetched_at)
+    except (OSError, ValueError):
+        return None, 0
+
+
+def write_check_state(tool_name, tag):
+    """Record the latest release of a tool, as just seen on the server"""
+    check_dir = get_check_dir()
+    path = os.path.join(check_dir, tool_name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(check_dir, exist_ok=True)
+        with open(tmp_path, "w") as f:
+            f.write(f"{tag} {time.time():.0f}\n")
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def read_installed_version(install_path):
+    """Read the .version file of an installation, or None"""
+    try:
+        with open(os.path.join(install_path, ".version")) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def start_background_refresh(tool_name, script_path):
+    """
+    Refresh the state file in a detached process, at most one at a time.
+
+    The child runs `<script> --refresh-check` in its own session with its
+    output discarded, so the calling shell neither waits for it nor sees it.
+    """
+    lock_path = os.path.join(get_check_dir(), f"{tool_name}.refresh")
+    try:
+        os.makedirs(get_check_dir(), exist_ok=True)
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if time.time() - os.stat(lock_path).st_mtime < REFRESH_LOCK_TIMEOUT:
+                return
+            os.unlink(lock_path)
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        os.close(fd)
+
+        # Only needed on this rare path
+        import subprocess
+
+        subprocess.Popen(
+            [sys.executable, script_path, "--refresh-check"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+            close_fds=True,
+        )
+    except OSError:
+        pass
+
+
+def finish_background_refresh(tool_name):
+    """Release the refresh lock taken by start_background_refresh()"""
+    try:
+        os.unlink(os.path.join(get_check_dir(), f"{tool_name}.refresh"))
+    except OSError:
+        pass
+
+
+def parse_check_arguments(argv):
+    """
+    Parse `--check [install_path] [--check-ttl SECONDS] [-q]` by hand.
+
+    Returns:
+        Tuple (install_path, ttl, quiet), or None if argv holds anything
+        else, in which case the caller falls back to argparse
+    """
+    install_path, ttl, quiet = None, DEFAULT_CHECK_TTL, False
+    args = iter(argv)
+    for arg in args:
+        if arg == "--check":
+            continue
+        if arg in ("-q", "--quiet"):
+            quiet = True
+        elif arg == "--check-ttl":
+            try:
+                ttl = int(next(args))
+            except (StopIteration, ValueError):
+                return None
+        elif arg.startswith("-") or install_path is not None:
+            return None
+        else:
+            install_path = arg
+    return install_path, ttl, quiet
+
+
+def check_tool(tool_name, install_path, ttl, script_path, quiet=False):
+    """
+    Compare the installed version with the latest known release, without network access.
+
+    Returns:
+        EXIT_UP_TO_DATE, EXIT_UPDATE_AVAILABLE or EXIT_UNKNOWN
+    """
+    latest, fetched_at = read_check_state(tool_name)
+    if latest is None or time.time() - fetched_at > ttl:
+        start_background_refresh(tool_name, script_path)
+
+    installed = read_installed_version(install_path) if install_path else None
+    if latest is None or installed is None:
+        if not quiet:
+            reason = "no release info cached yet" if latest is None else "not installed"
+            print(f"{tool_name}: unknown ({reason})")
+        return EXIT_UNKNOWN
+
+    if installed == latest:
+        if not quiet:
+            print(f"{tool_name} {installed} is up to date")
+        return EXIT_UP_TO_DATE
+
+    if not quiet:
+        print(f"{tool_name} {latest} is available (installed: {installed})")
+    return EXIT_UPDATE_AVAILABLE
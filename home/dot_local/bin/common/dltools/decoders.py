@@ -0,0 +1,144 @@
+"""
+Streaming decoders for the Content-Encoding of a response
+
+A decoder turns an iterable of encoded chunks into an iterator of decoded
+ones, so a large body is decoded while it is read, never held as a whole.
+gzip and deflate come from zlib; zstd comes from compression.zstd (Python
+3.14+) or the zstandard package, and br from the brotli or brotlicffi
+package, when they are installed. get_accept_encoding() advertises only
+what can be decoded here, so the server never picks an encoding we'd have
+to fail on.
+"""
+
+import zlib
+import itertools
+
+try:
+    from compression import zstd
+except ImportError:
+    zstd = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+
+# Upper bound of the output of one decoding step; list.js compresses very well
+DEFAULT_CHUNK_SIZE = 65536
+
+
+def decode_zlib(chunks, chunk_size, wbits):
+    inflater = zlib.decompressobj(wbits)
+    for data in chunks:
+        while data:
+            yield inflater.decompress(data, chunk_size)
+            data = inflater.unconsumed_tail
+    yield inflater.flush()
+
+
+def decode_gzip(chunks, chunk_size=DEFAULT_CHUNK_SIZE):
+    return decode_zlib(chunks, chunk_size, 16 + zlib.MAX_WBITS)
+
+
+def decode_deflate(chunks, chunk_size=DEFAULT_CHUNK_SIZE):
+    # "deflate" means a zlib stream, but some servers send raw deflate data;
+    # a zlib header has compression method 8 and is a multiple of 31
+    chunks = iter(chunks)
+    head = b""
+    for data in chunks:
+        head += data
+        if len(head) >= 2:
+            break
+    is_zlib = len(head) >= 2 and head[0] & 0x0F == 8 and (head[0] << 8 | head[1]) % 31 == 0
+    return decode_zlib(itertools.chain([head], chunks), chunk_size, zlib.MAX_WBITS if is_zlib else -zlib.MAX_WBITS)
+
+
+def decode_zstd(chunks, chunk_size=DEFAULT_CHUNK_SIZE):
+    if zstd is None:
+        # zstandard can't cap the output of a step
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        for data in chunks:
+            yield decompressor.decompress(data)
+        return
+
+    decompressor = zstd.ZstdDecompressor()
+    for data in chunks:
+        if decompressor.eof:
+            break
+        yield decompressor.decompress(data, chunk_size)
+        while not decompressor.needs_input and not decompressor.eof:
+            yield decompressor.decompress(b"", chunk_size)
+
+
+def decode_br(chunks, chunk_size=DEFAULT_CHUNK_SIZE):
+    decompressor = brotli.Decompressor()
+    if not hasattr(decompressor, "can_accept_more_data"):
+        # Before Brotli 1.2 the output of a step can't be capped. brotli and brotlicffi
+        # name the method process(); brotlipy names it decompress()
+        process = getattr(decompressor, "process", None) or decompressor.decompress
+        for data in chunks:
+            yield process(data)
+        return
+
+    for data in chunks:
+        output = decompressor.process(data, output_buffer_limit=chunk_size)
+        yield output
+        # Output held back by the limit comes with empty input
+        while not decompressor.is_finished() and (
+            len(output) >= chunk_size or not decompressor.can_accept_more_data()
+        ):
+            output = decompressor.process(b"", output_buffer_limit=chunk_size)
+            yield output
+
+
+# Content codings in the order they are advertised
+DECODERS = {"gzip": decode_gzip, "deflate": decode_deflate}
+if brotli is not None:
+    DECODERS["br"] = decode_br
+if zstd is not None or zstandard is not None:
+    DECODERS["zstd"] = decode_zstd
+
+# Old names some servers still send
+ALIASES = {"x-gzip": "gzip"}
+
+
+def get_accept_encoding():
+    """Get the Accept-Encoding value listing the codings that can be decoded"""
+    return ", ".join(DECODERS)
+
+
+def decode_chunks(chunks, content_encoding, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Undo the Content-Encoding of a body chunk by chunk.
+
+    Args:
+        chunks: Iterable of encoded byte chunks
+        content_encoding: Value of the Content-Encoding header; codings
+            listed one after the other are undone in reverse order
+        chunk_size: Upper bound of the output of one step, where the
+            decoder supports one
+
+    Returns:
+        Iterator of decoded byte chunks, some of which may be empty
+
+    Raises:
+        ValueError: A coding isn't supported
+    """
+    codings = [coding.strip().lower() for coding in (content_encoding or "").split(",")]
+    for coding in reversed(codings):
+        if coding in ("", "identity"):
+            continue
+        decoder = DECODERS.get(ALIASES.get(coding, coding))
+        if decoder is None:
+            raise ValueError(f"Unsupported Content-Encoding: {coding}")
+        chunks = decoder(chunks, chunk_size)
+    return iter(chunks)
@@ -0,0 +1,838 @@
+"""
+Resumable, optionally segmented HTTP downloads with streaming SHA-256
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import socket
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.request import Request
+from urllib.error import HTTPError
+
+from .events import span
+from .httppool import urlopen
+from .mirrors import CHUNK_SIZE, MIRROR_HEADERS, HedgedFetcher, probe_routes
+
+
+# Segmented downloads only kick in when every segment gets at least this much
+MIN_SEGMENT_SIZE = 1024 * 1024
+
+# A download is read into BUFFER_COUNT reusable buffers of this size, see copy_response()
+BUFFER_SIZE = 256 * 1024
+BUFFER_COUNT = 2
+
+# Minimum time between two redraws of the progress line, in seconds
+PROGRESS_INTERVAL = 0.25
+
+
+def calculate_sha256(file_path):
+    """Calculate SHA256 hash of a file"""
+    sha256_hash = hashlib.sha256()
+    with span("sha256") as record:
+        try:
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(BUFFER_SIZE), b""):
+                    sha256_hash.update(chunk)
+                    record["bytes"] += len(chunk)
+            return sha256_hash.hexdigest()
+        except Exception as e:
+            print(f"Error calculating SHA256: {e}")
+            record["ok"] = False
+            return None
+
+
+class StreamingSha256:
+    """
+    SHA-256 of a file computed from the bytes as they are downloaded.
+
+    Data has to be hashed in file order, while segmented downloads deliver
+    it out of order. Chunks at the current hash position are hashed right
+    away; chunks ahead of it are kept in memory up to max_pending bytes.
+    Beyond that budget (and for data from an earlier run) only the region
+    is remembered and read back from the file once the hash position
+    reaches it, which only touches the part of the file that wasn't hashed
+    while streaming.
+    """
+
+    def __init__(self, path, max_pending=64 * 1024 * 1024):
+        self.path = path
+        self.max_pending = max_pending
+        self.sha256 = hashlib.sha256()
+        self.position = 0
+        self.pending = {}
+        self.pending_bytes = 0
+        self.on_disk = {}
+        self.lock = threading.Lock()
+
+    def update(self, offset, data):
+        """Feed a chunk that was written to the file at the given offset"""
+        with self.lock:
+            if offset == self.position:
+                self.sha256.update(data)
+                self.position += len(data)
+                self._drain()
+            elif self.pending_bytes + len(data) <= self.max_pending:
+                self.pending[offset] = bytes(data)
+                self.pending_bytes += len(data)
+            else:
+                self._add_on_disk(offset, offset + len(data))
+
+    def mark_on_disk(self, start, end):
+        """Record that [start, end) is already in the file and was never fed"""
+        if start >= end:
+            return
+        with self.lock:
+            self._add_on_disk(start, end)
+            self._drain()
+
+    def hexdigest(self, total_size):
+        """Get the digest once all total_size bytes are in the file, or None if data is missing"""
+        with self.lock:
+            self._drain()
+            if self.position != total_size:
+                return None
+            return self.sha256.hexdigest()
+
+    def _add_on_disk(self, start, end):
+        # Extend the region that ends where this one starts
+        for region_start, region_end in self.on_disk.items():
+            if region_end == start:
+                self.on_disk[region_start] = end
+                return
+        self.on_disk[start] = end
+
+    def _drain(self):
+        while True:
+            if self.position in self.pending:
+                data = self.pending.pop(self.position)
+                self.pending_bytes -= len(data)
+                self.sha256.update(data)
+                self.position += len(data)
+            elif self.position in self.on_disk:
+                end = self.on_disk.pop(self.position)
+                with open(self.path, "rb") as f:
+                    f.seek(self.position)
+                    remaining = end - self.position
+                    while remaining > 0:
+                        chunk = f.read(min(1024 * 1024, remaining))
+                        if not chunk:
+                            return
+                        self.sha256.update(chunk)
+                        self.position += len(chunk)
+                        remaining -= len(chunk)
+            else:
+                return
+
+
+# Downloads in flight, by file name, for the combined progress line
+_progress = {}
+_progress_lock = threading.Lock()
+_progress_drawn_at = 0
+
+# Background runs leave the progress bar out of their log
+_progress_enabled = True
+
+
+def set_progress_enabled(enabled):
+    """Turn the progress bar of all downloads on or off"""
+    global _progress_enabled
+    _progress_enabled = enabled
+
+
+def print_progress(downloaded, total_size, filename=""):
+    """
+    Update the progress of a download and redraw the progress bar in place.
+
+    Cheap enough to call for every chunk: the line is redrawn at most every
+    PROGRESS_INTERVAL seconds, and when the download completes.
+
+    While several files download at once (dl-tools running tools in
+    parallel) a single combined status line is drawn instead.
+    """
+    global _progress_drawn_at
+    if total_size <= 0 or not _progress_enabled:
+        return
+    with _progress_lock:
+        _progress[filename] = (downloaded, total_size)
+        now = time.monotonic()
+        if now - _progress_drawn_at < PROGRESS_INTERVAL and downloaded < total_size:
+            return
+        _progress_drawn_at = now
+
+        if len(_progress) > 1:
+            status = " | ".join(
+                f"{name} {done / total * 100:.1f}%" for name, (done, total) in _progress.items()
+            )
+            print(f"\r{status}", end="", flush=True)
+            return
+
+    progress = downloaded / total_size * 100
+    bar_length = 50
+    filled = int(bar_length * downloaded / total_size)
+    bar = "=" * filled + "-" * (bar_length - filled)
+    print(
+        f"\r[{bar}] {progress:.1f}% ({downloaded / 1024 / 1024:.2f} MB)",
+        end="",
+        flush=True,
+    )
+
+
+def end_progress(filename=""):
+    """Finish the progress line of a download"""
+    with _progress_lock:
+        _progress.pop(filename, None)
+    if _progress_enabled:
+        print()  # New line after progress bar
+
+
+def copy_response(response, f, offset, length, on_written, cancelled=None):
+    """
+    Copy a response body into a file, reading and writing on separate threads.
+
+    The body is read with readinto() into BUFFER_COUNT preallocated buffers
+    that are passed back and forth between this thread, which only reads
+    from the network, and a writer thread, which writes them to f and hands
+    them on to on_written. Neither side waits for the other unless it gets
+    a whole buffer ahead, and no bytes object is created per chunk.
+
+    Args:
+        f: File open for writing, positioned at offset
+        offset: File offset of the first byte of the body
+        length: Number of bytes to copy at most, None for the whole body
+        on_written: Called on the writer thread with (file offset, memoryview)
+            once the data has been written; the view is only valid during the call
+        cancelled: threading.Event that stops the copy early
+
+    Returns:
+        Number of bytes copied
+    """
+    free_buffers = queue.Queue()
+    for _ in range(BUFFER_COUNT):
+        free_buffers.put(memoryview(bytearray(BUFFER_SIZE)))
+    filled_buffers = queue.Queue()
+    failures = []
+
+    def write_buffers():
+        while True:
+            item = filled_buffers.get()
+            if item is None:
+                return
+            buffer, size, position = item
+            try:
+                if not failures:
+                    view = buffer[:size]
+                    while view:
+                        view = view[f.write(view):]
+                    on_written(position, buffer[:size])
+            except BaseException as e:
+                failures.append(e)
+            free_buffers.put(buffer)
+
+    writer = threading.Thread(target=write_buffers, daemon=True)
+    writer.start()
+
+    position = offset
+    try:
+        while length is None or position < offset + length:
+            if failures or (cancelled is not None and cancelled.is_set()):
+                break
+            buffer = free_buffers.get()
+            wanted = BUFFER_SIZE if length is None else min(BUFFER_SIZE, offset + length - position)
+            size = response.readinto(buffer[:wanted])
+            if not size:
+                free_buffers.put(buffer)
+                break
+            filled_buffers.put((buffer, size, position))
+            position += size
+    finally:
+        filled_buffers.put(None)
+        writer.join()
+
+    if failures:
+        raise failures[0]
+    return position - offset
+
+
+class RemoteChangedError(Exception):
+    """The remote file no longer matches the validators of a partial download"""
+
+
+def get_part_paths(dest_path):
+    """Get the paths of the partial download file and its sidecar"""
+    return (
+        dest_path.with_name(dest_path.name + ".part"),
+        dest_path.with_name(dest_path.name + ".part.json"),
+    )
+
+
+def get_validators(headers):
+    """Extract the cache validators used to decide whether a partial download can be resumed"""
+    return {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+    }
+
+
+def get_if_range(state):
+    """Get the If-Range value for a partial download, or None if it can't be resumed safely"""
+    etag = state.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return state.get("last_modified")
+
+
+def validators_match(state, validators):
+    """Check that the validators recorded for a partial download still match the server"""
+    for key in ("etag", "last_modified"):
+        if state.get(key) and validators.get(key) and state[key] != validators[key]:
+            return False
+    return get_if_range(state) is not None
+
+
+def load_part_state(dest_path, url, expected_size):
+    """
+    Load the sidecar of a previous partial download.
+
+    Returns:
+        The sidecar dict if it belongs to the same URL and size, otherwise None
+    """
+    part_path, meta_path = get_part_paths(dest_path)
+    if not part_path.exists() or not meta_path.exists():
+        return None
+
+    try:
+        state = json.loads(meta_path.read_text())
+    except Exception:
+        return None
+
+    if state.get("url") != url:
+        return None
+    if expected_size > 0 and state.get("size", 0) not in (0, expected_size):
+        return None
+    if get_if_range(state) is None:
+        return None
+    return state
+
+
+def save_part_state(dest_path, state):
+    """Write the sidecar of a partial download atomically"""
+    _, meta_path = get_part_paths(dest_path)
+    tmp_path = meta_path.with_name(meta_path.name + ".tmp")
+    try:
+        tmp_path.write_text(json.dumps(state))
+        os.replace(tmp_path, meta_path)
+    except Exception as e:
+        print(f"\nWarning: Could not save partial download state: {e}")
+
+
+def discard_partial(dest_path):
+    """Remove a partial download and its sidecar"""
+    for path in get_part_paths(dest_path):
+        if path.exists():
+            path.unlink()
+
+
+def get_resume_offset(state, part_path):
+    """Get how many leading bytes of a partial download are complete"""
+    segments = state.get("segments")
+    if not segments:
+        return part_path.stat().st_size
+
+    # Only the contiguous prefix of a segmented download is usable by a single stream
+    offset = 0
+    for start, end, done in sorted(segments):
+        if start != offset:
+            break
+        offset += done
+        if done != end - start + 1:
+            break
+    return offset
+
+
+def finish_partial(dest_path, expected_total):
+    """Check the size of a completed partial download and move it into place"""
+    part_path, meta_path = get_part_paths(dest_path)
+
+    if not part_path.exists():
+        print("Error: Downloaded file does not exist!")
+        return False
+
+    actual_size = part_path.stat().st_size
+    if expected_total > 0 and actual_size != expected_total:
+        print(
+            f"Error: File size mismatch! Expected {expected_total} bytes, but file is {actual_size} bytes"
+        )
+        discard_partial(dest_path)
+        return False
+
+    os.replace(part_path, dest_path)
+    if meta_path.exists():
+        meta_path.unlink()
+
+    print(f"Download completed: {dest_path}")
+    print(f"File size verified: {actual_size / 1024 / 1024:.2f} MB")
+    return True
+
+
+def probe_range_support(url, headers=None):
+    """
+    Check whether the server serves byte ranges for the given URL.
+
+    A one-byte ranged GET is used instead of HEAD so that the redirect from
+    github.com to the object storage host is resolved at the same time.
+
+    Returns:
+        Tuple (final_url, total_size, validators) if ranges are supported, otherwise None
+    """
+    try:
+        headers = dict(headers or {})
+        headers["Range"] = "bytes=0-0"
+        req = Request(url, headers=headers)
+        with urlopen(req) as response:
+            if response.status != 206:
+                return None
+            if response.headers.get("Accept-Ranges", "bytes").lower() == "none":
+                return None
+
+            # Content-Range: bytes 0-0/12345
+            content_range = response.headers.get("Content-Range", "")
+            match = re.match(r"bytes\s+0-0/(\d+)$", content_range.strip())
+            if not match:
+                return None
+            return response.geturl(), int(match.group(1)), get_validators(response.headers)
+    except Exception:
+        return None
+
+
+def plan_segments(start, total_size, segments):
+    """Split the byte range [start, total_size) into segments of [start, end, done]"""
+    if start >= total_size:
+        return []
+    segment_size = -(-(total_size - start) // segments)
+    return [
+        [offset, min(offset + segment_size, total_size) - 1, 0]
+        for offset in range(start, total_size, segment_size)
+    ]
+
+
+def download_segmented(
+    url, final_url, dest_path, filename, total_size, segments, validators, headers=None
+):
+    """
+    Download file as concurrent byte ranges into a preallocated .part file.
+
+    Progress of every segment is recorded in the sidecar, so an interrupted
+    download continues each segment where it stopped.
+
+    Args:
+        url: Original asset URL, recorded in the sidecar
+        final_url: Post-redirect URL that serves byte ranges
+        dest_path: Path object of the output file
+        filename: Display name of the file
+        total_size: Size of the file in bytes, as reported by the server
+        segments: Number of concurrent range requests
+        validators: ETag / Last-Modified reported by the server
+        headers: Extra request headers
+
+    Returns:
+        SHA-256 hex digest of the file if every segment was downloaded
+        completely, otherwise None
+    """
+    part_path, _ = get_part_paths(dest_path)
+    state = load_part_state(dest_path, url, total_size)
+
+    if state and state.get("size") == total_size and validators_match(state, validators):
+        if state.get("segments"):
+            plan = state["segments"]
+        else:
+            # Continue a single-stream partial download: keep its prefix, split the rest
+            offset = min(part_path.stat().st_size, total_size)
+            plan = [[0, offset - 1, offset]] if offset else []
+            plan += plan_segments(offset, total_size, segments)
+        mode = "r+b"
+    else:
+        discard_partial(dest_path)
+        plan = plan_segments(0, total_size, segments)
+        mode = "wb"
+
+    state = {"url": url, "size": total_size, "segments": plan}
+    state.update(validators)
+
+    # Preallocate so every worker can write at its own offset
+    with open(part_path, mode) as f:
+        f.truncate(total_size)
+    save_part_state(dest_path, state)
+
+    hasher = StreamingSha256(part_path)
+    for start, end, done in plan:
+        hasher.mark_on_disk(start, start + done)
+
+    pending = [segment for segment in plan if segment[2] < segment[1] - segment[0] + 1]
+    downloaded = total_size - sum(segment[1] - segment[0] + 1 - segment[2] for segment in pending)
+
+    if downloaded:
+        print(f"Resuming {filename} at {downloaded / 1024 / 1024:.2f} MB in {len(pending)} segments...")
+    else:
+        print(f"Downloading {filename} in {len(pending)} segments...")
+    print(f"Size: {total_size / 1024 / 1024:.2f} MB")
+
+    lock = threading.Lock()
+    cancelled = threading.Event()
+    progress = {"downloaded": downloaded, "saved_at": time.monotonic()}
+    if_range = get_if_range(state)
+
+    def fetch_range(segment):
+        start, end, done = segment
+        range_headers = dict(headers or {})
+        range_headers["Range"] = f"bytes={start + done}-{end}"
+        if if_range:
+            range_headers["If-Range"] = if_range
+        req = Request(final_url, headers=range_headers)
+        with urlopen(req) as response:
+            if response.status != 206:
+                raise RemoteChangedError(
+                    f"Server answered a range request with HTTP {response.status}"
+                )
+
+            def on_written(position, data):
+                hasher.update(position, data)
+                with lock:
+                    segment[2] += len(data)
+                    progress["downloaded"] += len(data)
+                    print_progress(progress["downloaded"], total_size, filename)
+                    if time.monotonic() - progress["saved_at"] > 1:
+                        save_part_state(dest_path, state)
+                        progress["saved_at"] = time.monotonic()
+
+            # Unbuffered, so everything counted in the sidecar has reached the OS
+            with open(part_path, "r+b", buffering=0) as f:
+                f.seek(start + done)
+                copy_response(response, f, start + done, end - start + 1 - done, on_written, cancelled)
+            if cancelled.is_set():
+                return
+
+            if segment[2] != end - start + 1:
+                raise Exception(
+                    f"Segment {start}-{end} incomplete: expected {end - start + 1} bytes, got {segment[2]} bytes"
+                )
+
+    errors = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, len(pending))) as executor:
+            futures = [executor.submit(fetch_range, segment) for segment in pending]
+            try:
+                for future in as_completed(futures):
+                    if future.exception() is not None:
+                        # Stop the remaining segments on the first failure
+                        cancelled.set()
+                        errors.append(future.exception())
+            except KeyboardInterrupt:
+                cancelled.set()
+                raise
+    finally:
+        with lock:
+            save_part_state(dest_path, state)
+        end_progress(filename)
+
+    if errors:
+        if isinstance(errors[0], RemoteChangedError):
+            raise errors[0]
+        print(f"\nError during segmented download: {errors[0]}")
+        return None
+
+    if progress["downloaded"] != total_size:
+        return None
+    return hasher.hexdigest(total_size)
+
+
+def download_single(url, dest_path, filename, expected_size, headers=None):
+    """
+    Download file over a single connection into a .part file.
+
+    A matching partial download from an earlier run is continued with a
+    Range request; If-Range makes the server send the whole file instead
+    when it has changed in the meantime.
+
+    Returns:
+        SHA-256 hex digest of the downloaded file, or None if it failed
+    """
+    part_path, _ = get_part_paths(dest_path)
+    state = load_part_state(dest_path, url, expected_size)
+    offset = get_resume_offset(state, part_path) if state else 0
+
+    headers = dict(headers or {})
+    if offset > 0:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = get_if_range(state)
+
+    req = Request(url, headers=headers)
+    try:
+        response = urlopen(req)
+    except HTTPError as e:
+        if e.code == 416:
+            raise RemoteChangedError("Requested range not satisfiable")
+        raise
+
+    with response:
+        content_length = int(response.headers.get("Content-Length", 0))
+        validators = get_validators(response.headers)
+
+        if response.status == 206:
+            content_range = response.headers.get("Content-Range", "")
+            if not validators_match(state, validators):
+                raise RemoteChangedError("Validators changed")
+            if not re.match(rf"bytes\s+{offset}-", content_range.strip()):
+                raise RemoteChangedError(f"Unexpected Content-Range: {content_range}")
+            total_size = offset + content_length
+            print(f"Resuming {filename} at {offset / 1024 / 1024:.2f} MB...")
+        else:
+            if offset > 0:
+                print("Remote file changed, restarting download from the beginning")
+            offset = 0
+            total_size = content_length
+            print(f"Downloading {filename}...")
+
+        # Verify expected size matches
+        if expected_size > 0 and total_size > 0 and total_size != expected_size:
+            print(
+                f"\nWarning: Expected size {expected_size} doesn't match Content-Length {total_size}"
+            )
+
+        print(f"Size: {total_size / 1024 / 1024:.2f} MB")
+
+        state = {"url": url, "size": total_size, "segments": None}
+        state.update(validators)
+        if get_if_range(state) is not None:
+            save_part_state(dest_path, state)
+
+        # Only the resumed prefix has to be read back for the hash
+        hasher = StreamingSha256(part_path)
+        hasher.mark_on_disk(0, offset)
+
+        def on_written(position, data):
+            hasher.update(position, data)
+            print_progress(position + len(data), total_size, filename)
+
+        with open(part_path, "r+b" if offset else "wb") as f:
+            f.truncate(offset)
+            f.seek(offset)
+            downloaded = offset + copy_response(response, f, offset, None, on_written)
+
+        end_progress(filename)
+
+        # Verify download completeness
+        if total_size > 0 and downloaded != total_size:
+            print(
+                f"Error: Download incomplete! Expected {total_size} bytes, got {downloaded} bytes"
+            )
+            return None
+
+        digest = hasher.hexdigest(downloaded)
+        if not finish_partial(dest_path, downloaded):
+            return None
+        return digest
+
+
+def download_mirrored(url, routes, dest_path, filename, total_size, segments):
+    """
+    Download file chunk by chunk over the fastest of several routes.
+
+    Chunks are fetched by `segments` workers through a HedgedFetcher and
+    written to the preallocated .part file once complete. The sidecar marks
+    every finished chunk, so an interrupted download continues with the
+    missing ones; routes may serve different ETags, so no validators are
+    kept and only the digest the caller checks vouches for the content.
+
+    Args:
+        url: Original download URL, recorded in the sidecar
+        routes: Route dicts from probe_routes(), fastest first
+
+    Returns:
+        SHA-256 hex digest of the file if every chunk was downloaded, otherwise None
+    """
+    part_path, meta_path = get_part_paths(dest_path)
+    state = None
+    if part_path.exists() and meta_path.exists():
+        try:
+            state = json.loads(meta_path.read_text())
+        except Exception:
+            state = None
+    if state and state.get("mirrored") and state.get("url") == url and state.get("size") == total_size:
+        mode = "r+b"
+    else:
+        discard_partial(dest_path)
+        chunks = plan_segments(0, total_size, -(-total_size // CHUNK_SIZE))
+        state = {"url": url, "size": total_size, "mirrored": True, "segments": chunks}
+        mode = "wb"
+
+    with open(part_path, mode) as f:
+        f.truncate(total_size)
+    save_part_state(dest_path, state)
+
+    # Chunks are complete or not at all
+    hasher = StreamingSha256(part_path)
+    pending = []
+    for chunk in state["segments"]:
+        if chunk[2] == chunk[1] - chunk[0] + 1:
+            hasher.mark_on_disk(chunk[0], chunk[1] + 1)
+        else:
+            chunk[2] = 0
+            pending.append(chunk)
+    downloaded = total_size - sum(end - start + 1 for start, end, _ in pending)
+
+    if downloaded:
+        print(f"Resuming {filename} at {downloaded / 1024 / 1024:.2f} MB from {routes[0]['label']}...")
+    else:
+        print(f"Downloading {filename} from {routes[0]['label']}...")
+    print(f"Size: {total_size / 1024 / 1024:.2f} MB")
+
+    lock = threading.Lock()
+    progress = {"downloaded": downloaded, "saved_at": time.monotonic()}
+    fetcher = HedgedFetcher(routes, max_requests=segments * 3)
+
+    def fetch_chunk(chunk):
+        start, end, _ = chunk
+        data = fetcher.fetch(start, end)
+        with open(part_path, "r+b", buffering=0) as f:
+            f.seek(start)
+            f.write(data)
+        hasher.update(start, memoryview(data))
+        with lock:
+            chunk[2] = len(data)
+            progress["downloaded"] += len(data)
+            print_progress(progress["downloaded"], total_size, filename)
+            if time.monotonic() - progress["saved_at"] > 1:
+                save_part_state(dest_path, state)
+                progress["saved_at"] = time.monotonic()
+
+    errors = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(segments, len(pending)))) as executor:
+            futures = [executor.submit(fetch_chunk, chunk) for chunk in pending]
+            for future in as_completed(futures):
+                if future.exception() is not None and not errors:
+                    # Chunks already started finish; the ones still queued are dropped
+                    errors.append(future.exception())
+                    for other in futures:
+                        other.cancel()
+    finally:
+        fetcher.close()
+        with lock:
+            save_part_state(dest_path, state)
+        end_progress(filename)
+
+    if errors:
+        print(f"\nError during mirrored download: {errors[0]}")
+        return None
+    if progress["downloaded"] != total_size:
+        return None
+    return hasher.hexdigest(total_size)
+
+
+def download_once(url, dest_path, filename, expected_size, segments, headers=None, mirrors=None):
+    """
+    Run one download attempt, segmented when the server supports byte ranges.
+
+    With mirrors, the fastest of the original URL and the mirrors is picked
+    by probing them all, and the file is fetched with hedged chunks.
+
+    Returns:
+        SHA-256 hex digest of the downloaded file, or None if it failed
+    """
+    if mirrors:
+        routes = probe_routes([(url, headers or {})] + [(mirror, MIRROR_HEADERS) for mirror in mirrors], expected_size)
+        if routes:
+            total_size = routes[0]["size"]
+            digest = download_mirrored(url, routes, dest_path, filename, total_size, max(1, segments))
+            if digest is None or not finish_partial(dest_path, total_size):
+                return None
+            return digest
+        print("No route serves byte ranges of the expected size, trying the original URL directly")
+
+    if segments > 1:
+        probe = probe_range_support(url, headers)
+        if probe is None:
+            print("Server does not support range requests, using a single connection")
+        else:
+            final_url, total_size, validators = probe
+            if expected_size > 0 and total_size != expected_size:
+                print(
+                    f"\nWarning: Expected size {expected_size} doesn't match Content-Range size {total_size}"
+                )
+            segments = min(segments, max(1, total_size // MIN_SEGMENT_SIZE))
+            if segments > 1:
+                digest = download_segmented(
+                    url, final_url, dest_path, filename, total_size, segments, validators, headers
+                )
+                if digest is None:
+                    print("Error: Segmented download incomplete!")
+                    return None
+                if not finish_partial(dest_path, total_size):
+                    return None
+                return digest
+
+    return download_single(url, dest_path, filename, expected_size, headers)
+
+
+def download_file(
+    url, dest_path, filename, expected_size, segments=1, retries=3, headers=None, mirrors=None
+):
+    """
+    Download file with progress bar and integrity check.
+
+    The data is written to a .part file next to dest_path and only renamed
+    once complete. Failed attempts are retried, continuing the partial file;
+    a partial file that survives an interrupted run is continued by the next
+    run as long as the server still reports the same ETag / Last-Modified.
+
+    When segments > 1 and the server supports byte ranges, the file is
+    fetched over several concurrent connections; otherwise it falls back to
+    a single stream.
+
+    The SHA-256 is computed while the data streams in, so verifying the
+    download doesn't need another pass over the file.
+
+    mirrors are URLs of other copies of the file, see download_mirrored().
+    They are only safe to pass when the caller checks the returned digest
+    against one it trusts.
+
+    Returns:
+        SHA-256 hex digest of the downloaded file, or None if it failed
+    """
+    for attempt in range(retries + 1):
+        if attempt > 0:
+            delay = 2 ** (attempt - 1)
+            print(f"Retrying in {delay}s (attempt {attempt}/{retries})...")
+            time.sleep(delay)
+
+        try:
+            digest = download_once(url, dest_path, filename, expected_size, segments, headers, mirrors)
+            if digest:
+                return digest
+        except KeyboardInterrupt:
+            part_path, _ = get_part_paths(dest_path)
+            print("\n\nDownload interrupted by user")
+            if part_path.exists():
+                print(f"Partial download kept at {part_path}, run again to resume")
+            # Exiting is up to the front-end; in a worker thread it would only end the thread
+            raise
+        except RemoteChangedError as e:
+            print(f"\nRemote file changed during download: {e}")
+            discard_partial(dest_path)
+        except socket.timeout:
+            # A stalled connection: the next attempt continues the .part over a new one
+            print("\nError downloading file: timed out waiting for data")
+        except HTTPError as e:
+            print(f"\nError downloading file: HTTP Error {e.code} - {e.reason}")
+            # Client errors other than timeouts and rate limits won't go away on retry
+            if 400 <= e.code < 500 and e.code not in (408, 429):
+                break
+        except Exception as e:
+            print(f"\nError downloading file: {e}")
+
+    return None
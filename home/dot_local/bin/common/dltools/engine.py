@@ -0,0 +1,774 @@
+"""
+Tool installation engine: resolves and installs the tools of a manifest concurrently
+
+A tool is a dict as found in the manifest, e.g.
+
+    {"name": "jadx", "type": "github", "repo": "skylot/jadx",
+     "asset": "^jadx-[\\d.]+(\\.zip)$", "install_path": "$JADX_HOME",
+     "executables": ["bin/jadx", "bin/jadx-gui"]}
+
+    {"name": "jeb", "type": "52pojie",
+     "pattern": "/Tools/Android_Tools/JEB_demo_([\\d.]+)_by_CXV",
+     "target": "~/Downloads"}
+
+Every tool type has a resolve step (metadata only, decides what to fetch)
+and an install step (download, verify, install). dl-jadx and dl-jeb run
+one tool through both steps; dl-tools runs a whole manifest in parallel.
+"""
+
+import os
+import sys
+import json
+import heapq
+import argparse
+import threading
+import contextvars
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .cache import (
+    DEFAULT_CACHE_MAX_SIZE,
+    cache_discard,
+    cache_lookup,
+    cache_store,
+    copy_from_cache,
+    get_cache_dir,
+    get_cache_key,
+)
+from .check import write_check_state
+from .download import download_file
+from .events import set_current_tool, span
+from .github import find_release_asset, get_github_headers, get_latest_release
+from .locks import DEFAULT_LOCK_TIMEOUT, LockTimeoutError, get_work_dir, single_flight
+from .mirrors import expand_mirrors
+from .peers import fetch_from_peers
+from .install import (
+    DEFAULT_KEEP_VERSIONS,
+    activate_version,
+    clean_stale_staging,
+    get_current_version,
+    get_store_path,
+    migrate_legacy_install,
+    prune_versions,
+    stage_version,
+    verify_zip_file,
+)
+from .pojie import DEFAULT_PATTERN, find_files_by_pattern
+from .remotezip import fetch_changed_members
+from .sync import DEFAULT_SYNC_WORKERS, SyncState, get_sync_path, prune_synced_files
+from .throttle import run_at_low_priority
+
+
+# Number of tools resolved or installed at the same time
+DEFAULT_CONCURRENCY = 4
+
+
+def get_manifest_path():
+    """Get the default manifest location"""
+    config_home = os.environ.get("XDG_CONFIG_HOME") or Path.home() / ".config"
+    return Path(config_home) / "dl-tools" / "manifest.json"
+
+
+def expand_path(value):
+    """
+    Expand ~ and environment variables in a path from the manifest.
+
+    Returns:
+        Path object, or None if a referenced variable isn't set
+    """
+    expanded = os.path.expandvars(os.path.expanduser(value))
+    if "$" in expanded:
+        return None
+    return Path(expanded)
+
+
+def get_option(tool, args, name, default=None):
+    """Get a setting from the tool entry, falling back to the command line, then the default"""
+    if name in tool:
+        return tool[name]
+    value = getattr(args, name, None)
+    return default if value is None else value
+
+
+def parse_positive_int(value):
+    """
+    Parse a count option that must be at least 1, such as --newest.
+
+    Raises:
+        argparse.ArgumentTypeError
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid number: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value!r}")
+    return number
+
+
+def run_phase(tool, args, func, *func_args, **func_kwargs):
+    """Run a verify or extract step, at idle CPU/IO priority if the tool asks for low_priority"""
+    if get_option(tool, args, "low_priority", False):
+        return run_at_low_priority(func, *func_args, **func_kwargs)
+    return func(*func_args, **func_kwargs)
+
+
+def load_manifest(manifest_path):
+    """
+    Load the tool list from a manifest file.
+
+    Returns:
+        List of tool dicts, or None if the manifest is missing or invalid
+    """
+    try:
+        manifest = json.loads(Path(manifest_path).read_text())
+    except FileNotFoundError:
+        print(f"Error: Manifest not found: {manifest_path}")
+        return None
+    except Exception as e:
+        print(f"Error reading manifest {manifest_path}: {e}")
+        return None
+
+    tools = manifest.get("tools", []) if isinstance(manifest, dict) else manifest
+    names = set()
+    for tool in tools:
+        name = tool.get("name")
+        if not name or tool.get("type") not in TOOL_TYPES:
+            print(f"Error: Invalid manifest entry (needs a name and a known type): {tool}")
+            return None
+        if "newest" in tool and (
+            not isinstance(tool["newest"], int) or isinstance(tool["newest"], bool) or tool["newest"] < 1
+        ):
+            print(f"Error: Invalid manifest entry {name}: newest must be an integer of at least 1")
+            return None
+        if name in names:
+            print(f"Error: Duplicate tool name in manifest: {name}")
+            return None
+        names.add(name)
+    return tools
+
+
+def resolve_github_tool(tool, args):
+    """
+    Look up the latest GitHub release of a tool and decide whether to install it.
+
+    Returns:
+        Plan dict for install_github_tool(), or None on failure
+    """
+    install_path = expand_path(tool["install_path"])
+    if install_path is None:
+        print(f"Error: Installation path not set: {tool['install_path']}")
+        return None
+    print(f"Installation path: {install_path}")
+
+    # Get latest release info
+    print("Fetching latest release information...")
+    with span("release_info", repo=tool["repo"]) as record:
+        release_data = get_latest_release(
+            tool["repo"], get_option(tool, args, "metadata_ttl", 0), not args.no_cache
+        )
+        record["ok"] = release_data is not None
+    if release_data is None:
+        return None
+
+    latest_version = release_data["tag_name"]
+    print(f"Latest version: {latest_version}")
+    write_check_state(tool["name"], latest_version)
+    plan = {"tool": tool, "install_path": install_path, "version": latest_version}
+
+    # Check current version
+    current_version = get_current_version(install_path)
+    if current_version:
+        print(f"Current version: {current_version}")
+        if current_version == latest_version:
+            print("Already up to date!")
+            plan["up_to_date"] = True
+            return plan
+    else:
+        print("No existing installation found")
+
+    asset = find_release_asset(release_data, tool["asset"])
+    if not asset:
+        print(f"Error: Could not find an asset matching {tool['asset']} in release {latest_version}")
+        return None
+
+    print(f"Found asset: {asset['name']}")
+    if asset.get("size", 0) > 0:
+        print(f"Expected size: {asset['size'] / 1024 / 1024:.2f} MB")
+    if asset.get("digest"):
+        print(f"Expected SHA256: {asset['digest']}")
+
+    plan["asset"] = asset
+    return plan
+
+
+def install_github_tool(plan, args):
+    """
+    Download, verify and install the release asset picked by resolve_github_tool().
+
+    Concurrent runs installing to the same path, or fetching the same
+    asset, take turns; a run that waited skips what the other one did.
+
+    Returns:
+        True if successful, False otherwise
+    """
+    tool = plan["tool"]
+    asset = plan["asset"]
+    install_path = plan["install_path"]
+    timeout = get_option(tool, args, "lock_timeout", DEFAULT_LOCK_TIMEOUT)
+    artifact_key = asset.get("digest") or asset["browser_download_url"]
+
+    # Always install lock first, then artifact lock, so two runs can't deadlock
+    try:
+        with single_flight("install", os.path.abspath(install_path), timeout, f"installing to {install_path}") as waited:
+            if waited and get_current_version(install_path) == plan["version"]:
+                print(f"{plan['version']} was installed by the other run meanwhile")
+                return True
+            with single_flight("artifact", artifact_key, timeout, f"fetching {asset['name']}"):
+                work_dir = get_work_dir(artifact_key)
+                try:
+                    return install_github_asset(plan, args, work_dir)
+                finally:
+                    # Only a partial download from a failed run is kept, for resuming
+                    if work_dir.exists() and not any(work_dir.iterdir()):
+                        work_dir.rmdir()
+    except LockTimeoutError as e:
+        print(f"Error: {e}")
+        return False
+
+
+def get_asset_cache_key(asset, args):
+    """The GitHub digest is the cache key; assets without one aren't cached"""
+    if not asset.get("digest") or args.no_cache:
+        return None
+    return "sha256-" + get_asset_sha256(asset)
+
+
+def get_asset_sha256(asset):
+    """Get the hex SHA-256 of a release asset from its GitHub digest, or None"""
+    if not asset.get("digest"):
+        return None
+    return asset["digest"].replace("sha256:", "").lower()
+
+
+def download_github_asset(plan, args, work_dir):
+    """
+    Download the asset picked by resolve_github_tool() into work_dir and verify it.
+
+    Returns:
+        Path of the verified zip, or None on failure
+    """
+    tool = plan["tool"]
+    asset = plan["asset"]
+    expected_size = asset.get("size", 0)
+    zip_path = work_dir / asset["name"]
+
+    # Mirrors and peers can't be trusted without a digest to check their bytes against
+    mirrors = get_option(tool, args, "mirrors") or []
+    peers = get_option(tool, args, "peers") or []
+    if (mirrors or peers) and not asset.get("digest"):
+        print("Warning: The release lists no digest for the asset, ignoring the mirrors and peers")
+        mirrors = peers = []
+
+    actual_sha256 = None
+    if peers:
+        with span("peer", url=asset["browser_download_url"]) as record:
+            actual_sha256 = fetch_from_peers(
+                peers,
+                "sha256-" + get_asset_sha256(asset),
+                zip_path,
+                asset["name"],
+                expected_size,
+                get_asset_sha256(asset),
+                segments=get_option(tool, args, "segments", 4),
+            )
+            record["ok"] = bool(actual_sha256)
+            record["bytes"] = expected_size if actual_sha256 else 0
+
+    # Download the file
+    if not actual_sha256:
+        with span("download", url=asset["browser_download_url"]) as record:
+            actual_sha256 = download_file(
+                asset["browser_download_url"],
+                zip_path,
+                asset["name"],
+                expected_size,
+                segments=get_option(tool, args, "segments", 4),
+                retries=get_option(tool, args, "retries", 3),
+                headers=get_github_headers(),
+                mirrors=expand_mirrors(mirrors, asset["browser_download_url"]),
+            )
+            record["ok"] = bool(actual_sha256)
+            record["bytes"] = expected_size if actual_sha256 else 0
+    if not actual_sha256:
+        print("Download failed!")
+        return None
+
+    # Verify the downloaded file before proceeding
+    with span("verify", bytes=expected_size) as record:
+        record["ok"] = run_phase(
+            tool, args, verify_zip_file, zip_path, expected_size, asset.get("digest"), actual_sha256,
+            test_members=False,
+        )
+    if not record["ok"]:
+        print("Downloaded file verification failed!")
+        if mirrors:
+            print("One of the mirrors may serve a different file, try without --mirror")
+        return None
+    return zip_path
+
+
+def install_github_asset(plan, args, work_dir):
+    """
+    Body of install_github_tool(), run while holding its locks.
+
+    Args:
+        work_dir: Private download directory of the asset, see dltools.locks.get_work_dir()
+
+    Returns:
+        True if successful, False otherwise
+    """
+    tool = plan["tool"]
+    asset = plan["asset"]
+    install_path = plan["install_path"]
+    latest_version = plan["version"]
+
+    download_url = asset["browser_download_url"]
+    filename = asset["name"]
+    expected_size = asset.get("size", 0)
+    expected_sha256 = asset.get("digest", None)
+    cache_key = get_asset_cache_key(asset, args)
+    cache_max_size = get_option(tool, args, "cache_max_size", DEFAULT_CACHE_MAX_SIZE) * 1024 * 1024
+
+    zip_path = cache_lookup(cache_key) if cache_key else None
+    if zip_path:
+        with span("verify", bytes=expected_size, cached=True) as record:
+            record["ok"] = run_phase(
+                tool, args, verify_zip_file, zip_path, expected_size, expected_sha256, test_members=False
+            )
+        if not record["ok"]:
+            print("Cached file verification failed, downloading again")
+            cache_discard(cache_key)
+            zip_path = None
+
+    # Upgrade in place: fetch only the members that differ from the installed version
+    reuse = None
+    current_dir = install_path.resolve()
+    if not zip_path and get_option(tool, args, "incremental", False) and get_current_version(current_dir):
+        sparse_path = work_dir / f"{filename}.sparse"
+        with span("incremental", url=download_url) as record:
+            result = fetch_changed_members(
+                download_url,
+                sparse_path,
+                current_dir,
+                get_github_headers(),
+                expected_size,
+                get_option(tool, args, "segments", 4),
+            )
+            record["ok"] = result is not None
+            record["bytes"] = result[1] if result else 0
+        if result:
+            reuse, zip_path = result[0], sparse_path
+            print("Note: Only member CRC-32s can be checked in incremental mode, not the asset's SHA-256")
+        elif sparse_path.exists():
+            sparse_path.unlink()
+
+    if not zip_path:
+        zip_path = download_github_asset(plan, args, work_dir)
+        if not zip_path:
+            return False
+        if cache_key:
+            zip_path = cache_store(zip_path, cache_key, cache_max_size, move=True) or zip_path
+
+    # Build the new version next to the live one, then switch over atomically
+    versions_dir = get_store_path(install_path) / "versions"
+    versions_dir.mkdir(parents=True, exist_ok=True)
+    clean_stale_staging(versions_dir)
+
+    executables = tool.get("executables", [])
+    version_dir = run_phase(
+        tool, args, stage_version,
+        zip_path, versions_dir, latest_version, executables, get_option(tool, args, "jobs"), reuse,
+    )
+    if not version_dir and reuse is not None:
+        print("Incremental upgrade failed, downloading the full asset instead")
+        zip_path.unlink()
+        return install_github_asset(dict(plan, tool=dict(tool, incremental=False)), args, work_dir)
+    if not version_dir:
+        # A cached zip that fails its CRC checks must not be reused
+        if cache_key and zip_path.parent == get_cache_dir() / "artifacts":
+            cache_discard(cache_key)
+        print("Extraction failed!")
+        return False
+
+    try:
+        with span("activate"):
+            migrate_legacy_install(install_path, versions_dir)
+            activate_version(install_path, version_dir)
+            prune_versions(install_path, get_option(tool, args, "keep", DEFAULT_KEEP_VERSIONS))
+    except Exception as e:
+        print(f"Error switching to the new version: {e}")
+        return False
+
+    # Clean up (cached artifacts stay for the next install)
+    if zip_path.parent != get_cache_dir() / "artifacts":
+        print("Cleaning up temporary files...")
+        try:
+            zip_path.unlink()
+        except Exception as e:
+            print(f"Warning: Could not remove temp file: {e}")
+
+    print(f"\n✓ Successfully installed {tool['name']} {latest_version} to {install_path}")
+    if executables:
+        print(f"You can run it with: {install_path}/{executables[0]}")
+    return True
+
+
+def resolve_pojie_tool(tool, args):
+    """
+    Find the newest files matching the tool's 52pojie path pattern.
+
+    Returns:
+        Plan dict for install_pojie_tool(), or None on failure
+    """
+    target_dir = expand_path(tool["target"])
+    if target_dir is None:
+        print(f"Error: Target directory not set: {tool['target']}")
+        return None
+    print(f"Target directory: {target_dir}")
+
+    pattern = tool.get("pattern") or DEFAULT_PATTERN
+    print(f"Using pattern: {pattern}")
+
+    print("Fetching file list...")
+    with span("file_list", pattern=pattern) as record:
+        matched_files = find_files_by_pattern(
+            pattern,
+            get_option(tool, args, "metadata_ttl", 0),
+            not args.no_cache,
+            not getattr(args, "no_index", False),
+            get_option(tool, args, "full_match", False),
+            get_option(tool, args, "limit"),
+        )
+        record["ok"] = matched_files is not None
+    if matched_files is None:
+        return None
+
+    if not matched_files:
+        print(f"Error: No files found matching pattern: {pattern}")
+        return None
+
+    # Select the newest files (by time) without sorting every match; a sync takes all by default
+    sync = get_option(tool, args, "sync", False)
+    newest = get_option(tool, args, "newest", len(matched_files) if sync else 1)
+    selected_files = heapq.nlargest(newest, matched_files, key=lambda x: x[3])
+
+    print(f"Found {len(matched_files)} matching file(s), newest:")
+    for file_url, filename, file_size, modified_time in selected_files[:10]:
+        print(f"  - {filename} ({file_size / 1024 / 1024:.2f} MB)")
+    if len(selected_files) > 10:
+        print(f"  ... and {len(selected_files) - 10} more")
+
+    if len(matched_files) > len(selected_files):
+        print(f"\nMultiple matches found. Downloading the newest {len(selected_files)}")
+
+    return {"tool": tool, "target_dir": target_dir, "files": selected_files, "pattern": pattern}
+
+
+def download_matched_file(file_url, filename, file_size, modified_time, target_dir, tool, args):
+    """
+    Download one matched file to the target directory, going through the artifact cache.
+
+    Returns:
+        True if successful, False otherwise
+    """
+    # Create target directory if not exists
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    # Download file directly to target directory
+    output_path = target_dir / filename
+
+    # The .part file next to the output is only touched by one run at a time
+    timeout = get_option(tool, args, "lock_timeout", DEFAULT_LOCK_TIMEOUT)
+    try:
+        with single_flight("artifact", os.path.abspath(output_path), timeout, f"downloading {filename}") as waited:
+            if waited and output_path.is_file() and output_path.stat().st_size == file_size:
+                print(f"\n✓ {filename} was downloaded to {output_path} by the other run meanwhile")
+                return True
+            return download_to_target(file_url, output_path, file_size, modified_time, tool, args)
+    except LockTimeoutError as e:
+        print(f"Error: {e}")
+        return False
+
+
+def download_to_target(file_url, output_path, file_size, modified_time, tool, args):
+    """
+    Body of download_matched_file(), run while holding its lock.
+
+    Returns:
+        True if successful, False otherwise
+    """
+    filename = output_path.name
+    cache_key = None
+    if not args.no_cache:
+        cache_key = get_cache_key(file_url, file_size, modified_time)
+        cached_path = cache_lookup(cache_key)
+        if cached_path:
+            with span("cache_copy", bytes=file_size) as record:
+                record["ok"] = copy_from_cache(cached_path, output_path, file_size)
+            if record["ok"]:
+                print(f"\n✓ Successfully copied {filename} to {output_path} from cache")
+                return True
+            cache_discard(cache_key)
+
+    if not download_pojie_file(file_url, output_path, file_size, modified_time, tool, args):
+        return False
+
+    # A synced tree is a copy already; storing it too would double it on disk
+    # and push the tool artifacts out of the size-limited cache
+    if cache_key and not get_option(tool, args, "sync", False):
+        cache_max_size = get_option(tool, args, "cache_max_size", DEFAULT_CACHE_MAX_SIZE)
+        cache_store(output_path, cache_key, cache_max_size * 1024 * 1024)
+
+    print(f"\n✓ Successfully downloaded {filename} to {output_path}")
+    return True
+
+
+def download_pojie_file(file_url, output_path, file_size, modified_time, tool, args):
+    """
+    Download a 52pojie file, from a peer if one has it, otherwise from 52pojie.
+
+    A peer's copy is only checked against the size in list.js.
+
+    Returns:
+        True if successful, False otherwise
+    """
+    filename = output_path.name
+    peers = get_option(tool, args, "peers") or []
+    if peers:
+        with span("peer", url=file_url) as record:
+            cache_key = get_cache_key(file_url, file_size, modified_time)
+            record["ok"] = bool(fetch_from_peers(peers, cache_key, output_path, filename, file_size))
+            record["bytes"] = file_size if record["ok"] else 0
+        if record["ok"]:
+            return True
+
+    with span("download", url=file_url) as record:
+        record["ok"] = bool(
+            download_file(
+                file_url,
+                output_path,
+                filename,
+                file_size,
+                segments=get_option(tool, args, "segments", 1),
+                retries=get_option(tool, args, "retries", 3),
+            )
+        )
+        record["bytes"] = file_size if record["ok"] else 0
+    if not record["ok"]:
+        print("Download failed!")
+    return record["ok"]
+
+
+def sync_pojie_tool(plan, args):
+    """
+    Mirror the files picked by resolve_pojie_tool() into the target directory.
+
+    Files whose listed size and time match the sync state are skipped, the
+    rest are downloaded by a pool of workers. With prune, files synced
+    earlier that are no longer picked are deleted.
+
+    Returns:
+        True if every file is in place, False otherwise
+    """
+    tool = plan["tool"]
+    target_dir = plan["target_dir"]
+    state = SyncState(target_dir)
+
+    pending = []
+    listed = set()
+    for file_url, filename, file_size, modified_time in plan["files"]:
+        local_path = get_sync_path(target_dir, file_url, plan["pattern"])
+        if local_path is None:
+            print(f"Warning: Skipping unsafe path: {file_url}")
+            continue
+        relative_path = local_path.relative_to(target_dir).as_posix()
+        listed.add(relative_path)
+        if not state.is_current(relative_path, local_path, file_size, modified_time):
+            pending.append((file_url, local_path, relative_path, file_size, modified_time))
+
+    unchanged = len(listed) - len(pending)
+    print(f"Syncing {len(listed)} file(s) to {target_dir}: {len(pending)} to download, {unchanged} unchanged")
+
+    def sync_file(file_url, local_path, relative_path, file_size, modified_time):
+        if not download_matched_file(
+            file_url, local_path.name, file_size, modified_time, local_path.parent, tool, args
+        ):
+            return False
+        state.record(relative_path, file_size, modified_time)
+        return True
+
+    failed = 0
+    workers = get_option(tool, args, "workers", DEFAULT_SYNC_WORKERS)
+    try:
+        with span("sync", files=len(pending), workers=workers) as record:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                futures = {executor.submit(sync_file, *item): item for item in pending}
+                for future in as_completed(futures):
+                    if future.result():
+                        record["bytes"] += futures[future][3]
+                    else:
+                        failed += 1
+            record["ok"] = not failed
+
+        pruned = 0
+        if get_option(tool, args, "prune", False):
+            pruned = prune_synced_files(target_dir, state, listed)
+    finally:
+        state.save()
+
+    print(
+        f"\nSynced {target_dir}: {len(pending) - failed} downloaded, {unchanged} unchanged, "
+        f"{pruned} pruned, {failed} failed"
+    )
+    return not failed
+
+
+def install_pojie_tool(plan, args):
+    """
+    Download the files picked by resolve_pojie_tool().
+
+    Returns:
+        True if successful, False otherwise
+    """
+    if get_option(plan["tool"], args, "sync", False):
+        return sync_pojie_tool(plan, args)
+
+    success = True
+    for file_url, filename, file_size, modified_time in plan["files"]:
+        if not download_matched_file(
+            file_url, filename, file_size, modified_time, plan["target_dir"], plan["tool"], args
+        ):
+            success = False
+    return success
+
+
+# Resolve and install steps of each tool type
+TOOL_TYPES = {
+    "github": (resolve_github_tool, install_github_tool),
+    "52pojie": (resolve_pojie_tool, install_pojie_tool),
+}
+
+
+def install_tool(tool, args):
+    """
+    Resolve and install a single tool in the calling thread.
+
+    Returns:
+        True if successful (or already up to date), False otherwise
+    """
+    set_current_tool(tool["name"])
+    resolve, install = TOOL_TYPES[tool["type"]]
+    with span("total") as record:
+        plan = resolve(tool, args)
+        record["ok"] = plan is not None and (plan.get("up_to_date") or install(plan, args))
+    return record["ok"]
+
+
+class PrefixedOutput:
+    """
+    stdout replacement that tags every line with the tool whose thread wrote it.
+
+    Lines are buffered per thread and written whole, so output of tools
+    running in parallel doesn't interleave mid-line. Progress redraws
+    (starting with "\\r") are passed through as they come.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        # Per thread, and carried over to the threads of dltools.throttle.run_at_low_priority()
+        self.line = contextvars.ContextVar("line", default=None)
+        self.lock = threading.Lock()
+        self.in_progress_line = False
+
+    def set_prefix(self, prefix):
+        self.line.set({"prefix": prefix, "buffer": ""})
+
+    def write(self, text):
+        line_state = self.line.get()
+        with self.lock:
+            if line_state is None or text.startswith("\r"):
+                self.stream.write(text)
+                self.in_progress_line = text.startswith("\r") and not text.endswith("\n")
+                return len(text)
+
+            prefix = line_state["prefix"]
+            line_state["buffer"] += text
+            while "\n" in line_state["buffer"]:
+                line, line_state["buffer"] = line_state["buffer"].split("\n", 1)
+                if self.in_progress_line:
+                    # Finish the progress line; an empty line only meant that
+                    self.stream.write("\n")
+                    self.in_progress_line = False
+                    if not line:
+                        continue
+                self.stream.write(f"[{prefix}] {line}\n" if line else "\n")
+            return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def run_tools(tools, args, concurrency=DEFAULT_CONCURRENCY, tool_types=TOOL_TYPES):
+    """
+    Resolve and install several tools in parallel.
+
+    Every tool runs in its own thread, but at most `concurrency` of them
+    resolve or install at the same time. tool_types can swap in other
+    steps than installing, e.g. dltools.prefetch.PREFETCH_TYPES.
+
+    Returns:
+        Dict mapping tool name to True (installed or up to date) or False
+    """
+    slots = threading.Semaphore(max(1, concurrency))
+    output = PrefixedOutput(sys.stdout)
+
+    def run(tool):
+        output.set_prefix(tool["name"])
+        set_current_tool(tool["name"])
+        resolve, install = tool_types[tool["type"]]
+        with span("total") as record:
+            with slots:
+                plan = resolve(tool, args)
+            if plan is None or plan.get("up_to_date"):
+                record["ok"] = plan is not None
+            else:
+                with slots:
+                    record["ok"] = install(plan, args)
+        return record["ok"]
+
+    results = {}
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, len(tools))) as executor:
+            futures = {executor.submit(run, tool): tool["name"] for tool in tools}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    print(f"Error installing {name}: {e}")
+                    results[name] = False
+    except KeyboardInterrupt:
+        sys.stdout = output.stream
+        print("\n\nInterrupted by user, partial downloads are kept for the next run")
+        # Worker threads can't be interrupted; leave without waiting for them
+        sys.stdout.flush()
+        os._exit(1)
+    finally:
+        sys.stdout = output.stream
+
+    return results
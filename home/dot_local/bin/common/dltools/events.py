@@ -0,0 +1,110 @@
+"""
+Phase timing spans, written as newline-delimited JSON and summarized in a profile table
+
+Every span records wall time, CPU time and the bytes the phase moved.
+CPU time is measured for the whole process, so phases of tools running
+in parallel count each other's work.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+_lock = threading.Lock()
+_tool = contextvars.ContextVar("tool", default=None)
+_events_file = None
+_spans = []
+
+
+def configure_events(events_path=None):
+    """
+    Start recording spans, optionally streaming them to a file.
+
+    Args:
+        events_path: File that gets one JSON object per line ("-" for
+            stdout), or None to only keep spans for print_profile()
+    """
+    global _events_file
+    if events_path == "-":
+        _events_file = sys.stdout
+    elif events_path:
+        _events_file = open(events_path, "a", buffering=1)
+
+
+def set_current_tool(name):
+    """Attribute spans opened by the calling thread to the given tool"""
+    _tool.set(name)
+
+
+def emit_event(event):
+    """Write one event line, if an events file is configured"""
+    if _events_file is None:
+        return
+    line = json.dumps(event, sort_keys=True)
+    with _lock:
+        _events_file.write(line + "\n")
+        _events_file.flush()
+
+
+@contextmanager
+def span(phase, **fields):
+    """
+    Time a phase of an install.
+
+    The yielded dict can be filled in by the phase: "bytes" feeds the
+    throughput column, anything else is passed through to the event.
+    The span is marked failed when the body raises or sets "ok" to False.
+
+    Example:
+        with span("download", url=url) as record:
+            record["bytes"] = download(...)
+    """
+    record = {"bytes": 0, "ok": True}
+    record.update(fields)
+    started_at = time.time()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield record
+    except BaseException:
+        record["ok"] = False
+        raise
+    finally:
+        wall = time.perf_counter() - wall_start
+        event = {
+            "event": "span",
+            "phase": phase,
+            "tool": _tool.get(),
+            "started_at": round(started_at, 3),
+            "wall_s": round(wall, 6),
+            "cpu_s": round(time.process_time() - cpu_start, 6),
+            "mb_per_s": round(record["bytes"] / wall / 1024 / 1024, 3) if wall > 0 else None,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+        }
+        event.update(record)
+        with _lock:
+            _spans.append(event)
+        emit_event(event)
+
+
+def print_profile():
+    """Print a table of all recorded spans, in the order they finished"""
+    if not _spans:
+        return
+    print("\nProfile:")
+    print(f"  {'tool':<10} {'phase':<14} {'wall s':>9} {'cpu s':>9} {'MB':>9} {'MB/s':>9}")
+    for event in _spans:
+        throughput = event["mb_per_s"]
+        print(
+            f"  {event['tool'] or '-':<10} {event['phase']:<14}"
+            f" {event['wall_s']:>9.3f} {event['cpu_s']:>9.3f}"
+            f" {event['bytes'] / 1024 / 1024:>9.2f} {throughput if throughput else 0:>9.1f}"
+            f"{'' if event['ok'] else '  (failed)'}"
+        )
@@ -0,0 +1,77 @@
+"""
+GitHub release lookup
+"""
+
+import os
+import re
+import json
+from urllib.error import URLError, HTTPError
+
+from .cache import fetch_metadata
+
+
+# DL_TOOLS_GITHUB_API points the tools at a GitHub Enterprise host or a local stand-in
+GITHUB_API_URL = os.environ.get("DL_TOOLS_GITHUB_API", "https://api.github.com").rstrip("/")
+
+
+def get_github_headers(verbose=False):
+    """Get headers for GitHub API requests, including token if available"""
+    headers = {
+        "Accept": "application/vnd.github.v3+json",
+        "User-Agent": "dl-tools",
+    }
+
+    github_token = os.environ.get("GITHUB_TOKEN")
+    if github_token:
+        headers["Authorization"] = f"token {github_token}"
+        if verbose:
+            print("Using GitHub token for API requests")
+
+    return headers
+
+
+def get_latest_release(repo, ttl=0, use_cache=True):
+    """
+    Get the latest release information from GitHub API.
+
+    The response goes through the metadata cache, so unchanged release
+    info costs a 304 (which doesn't count against the rate limit) or, within
+    ttl seconds, no request at all.
+
+    Args:
+        repo: Repository as "owner/name"
+
+    Returns:
+        Release dict as returned by the API, or None on failure
+    """
+    api_url = f"{GITHUB_API_URL}/repos/{repo}/releases/latest"
+
+    try:
+        body = fetch_metadata(api_url, get_github_headers(verbose=True), ttl, use_cache)
+        data = json.loads(body.decode("utf-8"))
+        return data
+    except HTTPError as e:
+        print(f"HTTP Error: {e.code} - {e.reason}")
+    except URLError as e:
+        print(f"URL Error: {e.reason}")
+    except Exception as e:
+        print(f"Error fetching release info: {e}")
+    return None
+
+
+def find_release_asset(release_data, asset_pattern):
+    """
+    Find the first release asset whose name matches the pattern.
+
+    Args:
+        release_data: Release dict from get_latest_release()
+        asset_pattern: Regex the asset name must match from its start
+
+    Returns:
+        Asset dict, or None if no asset matches
+    """
+    pattern = re.compile(asset_pattern)
+    for asset in release_data.get("assets", []):
+        if pattern.match(asset["name"]):
+            return asset
+    return None
@@ -0,0 +1,349 @@
+"""
+Pooled keep-alive HTTP client shared by every request of a run
+
+urllib.request.urlopen() opens a new connection for every request and asks
+the server to close it afterwards, so the release lookup, the redirect to
+the asset storage host, every download segment and list.js each pay for
+their own TCP and TLS handshake. urlopen() here keeps connections open per
+host and hands them out again, follows redirects over pooled connections,
+and resumes the TLS session of an earlier connection when a host needs a
+new one. Proxies are taken from the environment, as urllib does. Body
+reads count against the rate limit of the run (see dltools.throttle).
+"""
+
+import io
+import ssl
+import socket
+import base64
+import threading
+import http.client
+from urllib.parse import quote, unquote, urljoin, urlsplit
+from urllib.request import Request, getproxies, proxy_bypass
+from urllib.error import URLError, HTTPError
+
+from .throttle import get_read_size, throttle
+
+
+# Idle connections kept per host: enough for the default 4 segments plus metadata requests
+MAX_IDLE_PER_HOST = 8
+
+MAX_REDIRECTS = 10
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+# Unread rests of a body up to this size are read off so the connection can be reused
+DRAIN_LIMIT = 64 * 1024
+
+# Seconds to wait for a connection, or for more data of a response, before giving up;
+# a stalled request would otherwise hang the run and the locks it holds
+DEFAULT_TIMEOUT = 30
+
+# Headers that must not follow a redirect to another host
+HOST_BOUND_HEADERS = ("authorization", "cookie", "host")
+
+# Characters left alone when a request target is percent-encoded ("%" keeps existing escapes)
+URL_SAFE_CHARS = "/%:@!$&'()*+,;=?~#[]"
+
+
+class TLSResumingConnection(http.client.HTTPSConnection):
+    """HTTPS connection that resumes the TLS session of an earlier connection to the same host"""
+
+    def __init__(self, pool, host, port, **kwargs):
+        super().__init__(host, port, context=pool.get_ssl_context(), **kwargs)
+        self.pool = pool
+
+    def get_session_key(self):
+        return f"{self._tunnel_host or self.host}:{self._tunnel_port or self.port}"
+
+    def connect(self):
+        # Plain TCP connect, plus the CONNECT request when tunnelling through a proxy
+        http.client.HTTPConnection.connect(self)
+        self.sock = self._context.wrap_socket(
+            self.sock,
+            server_hostname=self._tunnel_host or self.host,
+            session=self.pool.get_tls_session(self.get_session_key()),
+        )
+
+    def save_session(self):
+        # TLS 1.3 tickets arrive after the handshake, so this is called once a response was read
+        if self.sock is not None:
+            self.pool.save_tls_session(self.get_session_key(), getattr(self.sock, "session", None))
+
+    def close(self):
+        self.save_session()
+        super().close()
+
+
+class PooledResponse:
+    """
+    Response of urlopen(), with the attributes the dltools code uses from urllib's.
+
+    Closing it hands the connection back to the pool if the body was read
+    to the end (or only a small rest was left), otherwise the connection
+    is closed.
+    """
+
+    def __init__(self, pool, key, conn, response, url, sock=None):
+        self.pool = pool
+        self.key = key
+        self.conn = conn
+        self.response = response
+        self.url = url
+        self.sock = sock
+        self.aborted = False
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def read(self, amt=None):
+        data = self.response.read(get_read_size(amt))
+        throttle(len(data))
+        return data
+
+    def readinto(self, buffer):
+        size = self.response.readinto(memoryview(buffer)[:get_read_size(len(buffer))])
+        throttle(size)
+        return size
+
+    def geturl(self):
+        return self.url
+
+    def abort(self):
+        """Make a read blocked in another thread return; the connection is closed, not reused"""
+        self.aborted = True
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close(self):
+        conn, response = self.conn, self.response
+        if conn is None:
+            return
+        self.conn = None
+
+        # With will_close (HTTP/1.0, Connection: close) the response owns the socket
+        reusable = not response.will_close and conn.sock is not None and not self.aborted
+        if reusable and not response.isclosed():
+            try:
+                if response.length is None or response.length <= DRAIN_LIMIT:
+                    response.read(DRAIN_LIMIT)
+                reusable = response.isclosed()
+            except (OSError, http.client.HTTPException):
+                reusable = False
+
+        response.close()
+        if reusable:
+            self.pool.release(self.key, conn)
+        else:
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ConnectionPool:
+    """Idle keep-alive connections per (scheme, host, port, proxy), safe to share between threads"""
+
+    def __init__(self, max_idle_per_host=MAX_IDLE_PER_HOST):
+        self.max_idle_per_host = max_idle_per_host
+        self.idle = {}
+        self.tls_sessions = {}
+        self.proxies = {}
+        self.ssl_context = None
+        self.lock = threading.Lock()
+
+    def get_ssl_context(self):
+        # Sessions can only be resumed within the context that created them
+        with self.lock:
+            if self.ssl_context is None:
+                self.ssl_context = ssl.create_default_context()
+            return self.ssl_context
+
+    def get_tls_session(self, session_key):
+        with self.lock:
+            return self.tls_sessions.get(session_key)
+
+    def save_tls_session(self, session_key, session):
+        if session is not None:
+            with self.lock:
+                self.tls_sessions[session_key] = session
+
+    def get_proxy(self, scheme, host):
+        """
+        Look up the proxy for scheme://host from the environment.
+
+        Returns:
+            Tuple (proxy host, proxy port, Proxy-Authorization value or None),
+            or None to connect directly
+        """
+        with self.lock:
+            if (scheme, host) in self.proxies:
+                return self.proxies[(scheme, host)]
+
+        proxy_url = getproxies().get(scheme)
+        proxy = None
+        if proxy_url and not proxy_bypass(host):
+            parts = urlsplit(proxy_url if "://" in proxy_url else f"http://{proxy_url}")
+            auth = None
+            if parts.username:
+                credentials = f"{unquote(parts.username)}:{unquote(parts.password or '')}"
+                auth = "Basic " + base64.b64encode(credentials.encode()).decode("ascii")
+            proxy = (parts.hostname, parts.port or 80, auth)
+
+        with self.lock:
+            self.proxies[(scheme, host)] = proxy
+        return proxy
+
+    def acquire(self, key, timeout):
+        """
+        Take an idle connection for key, or create a new one.
+
+        Returns:
+            Tuple (connection, whether it was used before)
+        """
+        with self.lock:
+            idle = self.idle.get(key)
+            if idle:
+                return idle.pop(), True
+
+        scheme, host, port, proxy = key
+        kwargs = {} if timeout is None else {"timeout": timeout}
+        if scheme == "https":
+            if proxy:
+                conn = TLSResumingConnection(self, proxy[0], proxy[1], **kwargs)
+                conn.set_tunnel(host, port, {"Proxy-Authorization": proxy[2]} if proxy[2] else None)
+            else:
+                conn = TLSResumingConnection(self, host, port, **kwargs)
+        elif proxy:
+            conn = http.client.HTTPConnection(proxy[0], proxy[1], **kwargs)
+        else:
+            conn = http.client.HTTPConnection(host, port, **kwargs)
+        return conn, False
+
+    def release(self, key, conn):
+        """Put a connection whose last response was read completely back into the pool"""
+        if isinstance(conn, TLSResumingConnection):
+            conn.save_session()
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def send(self, method, url, headers, body=None, timeout=None):
+        """
+        Send one request, without following redirects.
+
+        A pooled connection the server has closed in the meantime is
+        replaced by a new one and the request sent again.
+
+        Returns:
+            PooledResponse
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise URLError(f"unsupported URL: {url}")
+
+        host = parts.hostname
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        proxy = self.get_proxy(parts.scheme, host)
+        key = (parts.scheme, host, port, proxy)
+
+        headers = dict(headers)
+        if proxy and parts.scheme == "http":
+            # Plain HTTP goes to the proxy with the absolute URL as target
+            target = url
+            if proxy[2]:
+                headers["Proxy-Authorization"] = proxy[2]
+        else:
+            target = parts.path or "/"
+            if parts.query:
+                target += "?" + parts.query
+
+        # 52pojie paths are used as listed, with spaces and non-ASCII names
+        target = quote(target, safe=URL_SAFE_CHARS)
+
+        while True:
+            conn, reused = self.acquire(key, timeout)
+            try:
+                if reused and conn.sock is not None:
+                    # The connection may have been opened for a request with another timeout
+                    conn.sock.settimeout(timeout)
+                conn.request(method, target, body=body, headers=headers)
+                # With Connection: close the response takes the socket over from conn
+                sock = conn.sock
+                response = conn.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                if reused:
+                    continue
+                if isinstance(e, OSError):
+                    raise URLError(e)
+                raise
+            return PooledResponse(self, key, conn, response, url, sock)
+
+    def open(self, request, timeout=None):
+        """Send a request and follow redirects, see urlopen()"""
+        if isinstance(request, str):
+            request = Request(request)
+        url = request.full_url
+        method = request.get_method()
+        headers = dict(request.header_items())
+        body = request.data
+
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self.send(method, url, headers, body, timeout)
+            location = response.headers.get("Location")
+            if response.status not in REDIRECT_CODES or not location:
+                break
+
+            # The redirect body is drained, so the connection goes straight back to the pool
+            response.close()
+            new_url = urljoin(url, location)
+            if urlsplit(new_url).netloc != urlsplit(url).netloc:
+                headers = {k: v for k, v in headers.items() if k.lower() not in HOST_BOUND_HEADERS}
+            if response.status == 303:
+                method, body = "GET", None
+            url = new_url
+        else:
+            raise HTTPError(url, response.status, "Too many redirects", response.headers, None)
+
+        if not 200 <= response.status < 300:
+            error_body = response.read(DRAIN_LIMIT)
+            response.close()
+            raise HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(error_body))
+        return response
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The connection pool shared by all requests of this process"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+
+def urlopen(request, timeout=DEFAULT_TIMEOUT):
+    """
+    Open a URL over a pooled keep-alive connection, following redirects.
+
+    Stands in for urllib.request.urlopen() in dltools: it takes a URL or a
+    Request, raises HTTPError for every status outside 2xx (304 included)
+    and URLError when the server can't be reached. A read that gets no
+    data within timeout seconds raises socket.timeout.
+
+    Returns:
+        PooledResponse; close it (or use it as a context manager) to hand
+        the connection back
+    """
+    return get_pool().open(request, timeout)
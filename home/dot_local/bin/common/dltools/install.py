@@ -0,0 +1,558 @@
+"""
+Verification, extraction and versioned installation of zip archives
+"""
+
+import os
+import re
+import stat
+import time
+import shutil
+import hashlib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .download import calculate_sha256
+from .events import span
+
+
+def get_current_version(install_path):
+    """Get currently installed version from version file"""
+    version_file = install_path / ".version"
+    if version_file.exists():
+        try:
+            return version_file.read_text().strip()
+        except Exception:
+            return None
+    return None
+
+
+def save_version(install_path, version):
+    """Save version information to file"""
+    version_file = install_path / ".version"
+    try:
+        version_file.write_text(version)
+    except Exception as e:
+        print(f"Warning: Could not save version info: {e}")
+
+
+def verify_zip_file(
+    zip_path, expected_size, expected_sha256=None, actual_sha256=None, test_members=True
+):
+    """
+    Verify that the zip file exists, is valid, and has correct size and hash.
+
+    Args:
+        zip_path: Path object of the zip file
+        expected_size: Size from the release asset (0 if unknown)
+        expected_sha256: Digest from the release asset, with or without "sha256:" prefix
+        actual_sha256: Digest computed while downloading; the file is hashed
+            again only when this is missing
+        test_members: Decompress every member to check its CRC. Callers that
+            go on to extract_zip() can skip this, since extraction checks it too
+    """
+    try:
+        # Check file exists
+        if not zip_path.exists():
+            print(f"Error: File does not exist: {zip_path}")
+            return False
+
+        # Check file size
+        actual_size = zip_path.stat().st_size
+        if actual_size == 0:
+            print("Error: Downloaded file is empty!")
+            return False
+
+        if expected_size > 0 and actual_size != expected_size:
+            print("Error: File size mismatch!")
+            print(f"  Expected: {expected_size / 1024 / 1024:.2f} MB")
+            print(f"  Actual:   {actual_size / 1024 / 1024:.2f} MB")
+            return False
+
+        # Verify SHA256 hash if provided
+        if expected_sha256:
+            if not actual_sha256:
+                print("Calculating SHA256 hash...")
+                actual_sha256 = calculate_sha256(zip_path)
+            if not actual_sha256:
+                print("Error: Could not calculate file hash")
+                return False
+
+            # GitHub API returns hash with "sha256:" prefix in some cases
+            expected_hash = expected_sha256.replace("sha256:", "").lower()
+            actual_hash = actual_sha256.lower()
+
+            if actual_hash != expected_hash:
+                print("Error: SHA256 hash mismatch!")
+                print(f"  Expected: {expected_hash}")
+                print(f"  Actual:   {actual_hash}")
+                return False
+            print(f"SHA256 verified: {actual_hash}")
+
+        # Verify it's a valid zip file
+        print("Verifying zip file integrity...")
+        try:
+            with zipfile.ZipFile(zip_path, "r") as zip_ref:
+                if not test_members:
+                    print("Zip central directory OK (member CRCs are checked on extraction)")
+                    return True
+
+                # Test the zip file
+                with span("testzip", bytes=zip_path.stat().st_size) as record:
+                    corrupt_file = zip_ref.testzip()
+                    record["ok"] = corrupt_file is None
+                if corrupt_file is not None:
+                    print(
+                        f"Error: Zip file is corrupted! First bad file: {corrupt_file}"
+                    )
+                    return False
+            print("Zip file verification passed")
+            return True
+        except zipfile.BadZipFile:
+            print("Error: File is not a valid zip file or is corrupted!")
+            return False
+
+    except Exception as e:
+        print(f"Error verifying file: {e}")
+        return False
+
+
+def get_member_target(extract_to, name):
+    """
+    Resolve where a zip member should be written.
+
+    Returns:
+        Path inside extract_to, or None if the name would escape it
+    """
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+    if not parts or ".." in parts or ":" in parts[0]:
+        return None
+    return extract_to.joinpath(*parts)
+
+
+def extract_members(zip_path, extract_to, members):
+    """
+    Extract a batch of members with a ZipFile handle of our own.
+
+    Reading a member to the end makes zipfile check its CRC and raise
+    BadZipFile on a mismatch.
+
+    Returns:
+        Number of bytes written
+    """
+    written = 0
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        for info, target in members:
+            with zip_ref.open(info) as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+
+            # Keep the unix permission bits recorded by the archiver
+            mode = (info.external_attr >> 16) & 0o777
+            if mode:
+                os.chmod(target, mode)
+            written += info.file_size
+    return written
+
+
+def link_or_copy(source, target):
+    """Hardlink source to target, or copy it where hardlinks aren't possible"""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def extract_zip(zip_path, extract_to, jobs=None, reuse=None):
+    """
+    Extract zip file to destination, spreading members over worker threads.
+
+    Args:
+        zip_path: Path object of the zip file
+        extract_to: Destination directory
+        jobs: Number of worker threads (default: CPU count)
+        reuse: Dict mapping member names to existing files that are linked
+            into place instead of being extracted (see dltools.remotezip)
+    """
+    try:
+        print(f"Extracting {zip_path.name}...")
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            infos = zip_ref.infolist()
+
+        # Create the directory skeleton up front so workers only write files
+        files = []
+        reused = 0
+        for info in infos:
+            target = get_member_target(extract_to, info.filename)
+            if target is None:
+                print(f"Error: Refusing to extract unsafe path: {info.filename}")
+                return False
+            if info.is_dir():
+                target.mkdir(parents=True, exist_ok=True)
+            elif reuse and info.filename in reuse:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                link_or_copy(reuse[info.filename], target)
+                reused += 1
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                files.append((info, target))
+
+        # Balance batches by compressed size, largest members first
+        jobs = max(1, min(jobs or os.cpu_count() or 1, len(files) or 1))
+        batches = [[] for _ in range(jobs)]
+        loads = [0] * jobs
+        for info, target in sorted(files, key=lambda item: item[0].compress_size, reverse=True):
+            index = loads.index(min(loads))
+            batches[index].append((info, target))
+            loads[index] += info.compress_size
+
+        with span("extract", files=len(files), jobs=jobs) as record:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = [
+                    executor.submit(extract_members, zip_path, extract_to, batch)
+                    for batch in batches
+                    if batch
+                ]
+                total = sum(future.result() for future in as_completed(futures))
+            record["bytes"] = total
+
+        print(f"Extracted {len(files)} files ({total / 1024 / 1024:.2f} MB) to: {extract_to}")
+        if reused:
+            print(f"Took {reused} unchanged files from the installed version")
+        return True
+    except zipfile.BadZipFile as e:
+        print(f"Error: Zip file is corrupted: {e}")
+        return False
+    except Exception as e:
+        print(f"Error extracting zip: {e}")
+        return False
+
+
+def set_executable_permissions(install_path, executable_files):
+    """
+    Set executable permissions for specified files.
+
+    Args:
+        install_path: Base installation directory
+        executable_files: List of relative paths to files that need executable permission
+    """
+    print("\nSetting executable permissions...")
+    success_count = 0
+
+    for relative_path in executable_files:
+        file_path = install_path / relative_path
+
+        if not file_path.exists():
+            print(f"  Warning: File not found: {relative_path}")
+            continue
+
+        try:
+            # Get current permissions
+            current_permissions = file_path.stat().st_mode
+
+            # Add executable permission for user, group, and others
+            # stat.S_IXUSR (user execute), stat.S_IXGRP (group execute), stat.S_IXOTH (others execute)
+            new_permissions = current_permissions | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
+
+            # Set the new permissions
+            os.chmod(file_path, new_permissions)
+
+            print(f"  ✓ Set executable: {relative_path}")
+            success_count += 1
+        except Exception as e:
+            print(f"  ✗ Failed to set executable for {relative_path}: {e}")
+
+    print(f"Set executable permissions for {success_count}/{len(executable_files)} files")
+    return success_count == len(executable_files)
+
+
+# Number of stored versions prune_versions() keeps: the current and the previous one
+DEFAULT_KEEP_VERSIONS = 2
+
+
+def get_store_path(install_path):
+    """
+    Get the version store that sits next to the installation path.
+
+    install_path itself is a symlink into <parent>/.<name>.store/versions/,
+    so an install or rollback is a single atomic symlink replacement.
+    Files are shared between versions as hardlinks into objects/, see
+    dedupe_version().
+    """
+    return install_path.parent / f".{install_path.name}.store"
+
+
+def point_symlink(link_path, target):
+    """Atomically (re)point link_path at target, using a relative link"""
+    tmp_link = link_path.with_name(f".{link_path.name}.{os.getpid()}.tmp")
+    if tmp_link.is_symlink():
+        tmp_link.unlink()
+    os.symlink(os.path.relpath(target, link_path.parent), tmp_link)
+    os.replace(tmp_link, link_path)
+
+
+def clean_stale_staging(versions_dir):
+    """Remove staging directories left behind by runs that no longer exist"""
+    if not versions_dir.exists():
+        return
+    for item in versions_dir.iterdir():
+        match = re.match(r"^\.staging-.*-(\d+)$", item.name)
+        if not match:
+            continue
+        try:
+            os.kill(int(match.group(1)), 0)
+            continue
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            continue
+        print(f"Removing stale staging directory: {item.name}")
+        shutil.rmtree(item, ignore_errors=True)
+
+
+def migrate_legacy_install(install_path, versions_dir):
+    """
+    Move a plain-directory installation into the version store.
+
+    This is the only step that isn't atomic: between the rename and the new
+    symlink install_path briefly doesn't exist. It happens once per host.
+    """
+    if install_path.is_symlink() or not install_path.is_dir():
+        return
+
+    legacy_version = get_current_version(install_path) or f"legacy-{int(time.time())}"
+    legacy_dir = versions_dir / legacy_version
+    if legacy_dir.exists():
+        legacy_dir = versions_dir / f"{legacy_version}-{int(time.time())}"
+
+    print(f"Moving existing installation into the version store: {legacy_dir}")
+    versions_dir.mkdir(parents=True, exist_ok=True)
+    install_path.rename(legacy_dir)
+    point_symlink(install_path, legacy_dir)
+
+
+def hash_file(path):
+    """SHA-256 hex digest of a file"""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def dedupe_version(version_dir, objects_dir, jobs=None):
+    """
+    Replace files that an earlier version already has by hardlinks.
+
+    Every file is keyed by its SHA-256 and permission bits (hardlinks share
+    their mode) under objects_dir/<first two hex digits>/. A file whose key
+    exists is replaced by a link to that object, a new one becomes the
+    object. Hardlinked files must be treated as read-only, since writing to
+    one changes every version that shares it.
+
+    Returns:
+        Number of bytes saved
+    """
+    files = []
+    for root, _, names in os.walk(version_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            info = os.lstat(path)
+            if stat.S_ISREG(info.st_mode):
+                files.append((path, info))
+
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(files) or 1))
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        digests = list(executor.map(hash_file, [path for path, _ in files]))
+
+    saved = 0
+    for (path, info), digest in zip(files, digests):
+        object_path = objects_dir / digest[:2] / f"{digest}-{stat.S_IMODE(info.st_mode):o}"
+        try:
+            if object_path.exists():
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                os.link(object_path, tmp_path)
+                os.replace(tmp_path, path)
+                saved += info.st_size
+            else:
+                object_path.parent.mkdir(parents=True, exist_ok=True)
+                os.link(path, object_path)
+        except FileExistsError:
+            continue
+        except OSError as e:
+            # No hardlinks on this filesystem; the version just isn't deduplicated
+            print(f"Warning: Could not deduplicate {version_dir.name}: {e}")
+            break
+    return saved
+
+
+def prune_objects(objects_dir):
+    """Delete objects that no stored version links to anymore"""
+    if not objects_dir.exists():
+        return
+    for object_path in objects_dir.glob("*/*"):
+        try:
+            if object_path.stat().st_nlink == 1:
+                object_path.unlink()
+        except OSError:
+            pass
+
+
+def stage_version(zip_path, versions_dir, version, executables=(), jobs=None, reuse=None):
+    """
+    Extract and prepare a version next to the live one.
+
+    reuse is passed on to extract_zip().
+
+    Returns:
+        Path of the finished version directory, or None on failure
+    """
+    staging_dir = versions_dir / f".staging-{version}-{os.getpid()}"
+    if staging_dir.exists():
+        shutil.rmtree(staging_dir)
+    staging_dir.mkdir(parents=True)
+
+    try:
+        # Extract the zip file into the staging directory
+        if not extract_zip(zip_path, staging_dir, jobs, reuse):
+            return None
+
+        # Check if ZIP extracted to a single subdirectory (e.g., jadx-1.4.7/)
+        # If so, that subdirectory becomes the version directory as a whole
+        with span("flatten"):
+            extracted_items = list(staging_dir.iterdir())
+            prepared_dir = staging_dir
+            if len(extracted_items) == 1 and extracted_items[0].is_dir():
+                prepared_dir = extracted_items[0]
+                print(f"Flattening nested directory: {prepared_dir.name}")
+
+        # Save version info
+        save_version(prepared_dir, version)
+
+        # Set executable permissions for binary files
+        if executables:
+            with span("permissions") as record:
+                record["ok"] = set_executable_permissions(prepared_dir, executables)
+
+        # Share the files that didn't change with the versions already stored
+        with span("dedupe") as record:
+            record["bytes"] = dedupe_version(prepared_dir, versions_dir.parent / "objects", jobs)
+        if record["bytes"]:
+            print(f"Shared {record['bytes'] / 1024 / 1024:.2f} MB of unchanged files with stored versions")
+
+        version_dir = versions_dir / version
+        if version_dir.exists():
+            version_dir = versions_dir / f"{version}-{int(time.time())}"
+        prepared_dir.rename(version_dir)
+        return version_dir
+    finally:
+        if staging_dir.exists():
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def activate_version(install_path, version_dir):
+    """Switch install_path to version_dir and remember the old target for --rollback"""
+    store_path = get_store_path(install_path)
+    old_target = install_path.resolve() if install_path.is_symlink() else None
+
+    point_symlink(install_path, version_dir)
+    if old_target and old_target != version_dir.resolve() and old_target.exists():
+        point_symlink(store_path / "previous", old_target)
+
+
+def prune_versions(install_path, keep=DEFAULT_KEEP_VERSIONS):
+    """
+    Delete all but the newest keep stored versions.
+
+    The current and the previous version are always kept, then the most
+    recently installed others until there are keep of them. Objects no
+    version links to anymore are deleted as well.
+    """
+    store_path = get_store_path(install_path)
+    versions_dir = store_path / "versions"
+    kept = {install_path.resolve()}
+    previous_link = store_path / "previous"
+    if previous_link.is_symlink():
+        kept.add(previous_link.resolve())
+
+    others = sorted(
+        (item for item in versions_dir.iterdir() if not item.name.startswith(".") and item.resolve() not in kept),
+        key=lambda item: item.stat().st_mtime,
+        reverse=True,
+    )
+    for item in others[max(0, keep - len(kept)):]:
+        print(f"Removing old version: {item.name}")
+        shutil.rmtree(item, ignore_errors=True)
+
+    prune_objects(store_path / "objects")
+
+
+def use_version(install_path, version):
+    """Switch install_path to a stored version; the one it leaves becomes the --rollback target"""
+    version_dir = get_store_path(install_path) / "versions" / version
+    if version.startswith(".") or not version_dir.is_dir():
+        print(f"Error: Version {version} is not in the store, see --list")
+        return False
+
+    activate_version(install_path, version_dir)
+    print(f"✓ Switched {install_path} to {get_current_version(install_path) or version}")
+    return True
+
+
+def list_versions(install_path):
+    """Print the stored versions with their size and the share that is their own"""
+    store_path = get_store_path(install_path)
+    versions_dir = store_path / "versions"
+    if not versions_dir.is_dir():
+        print(f"No version store at {store_path}")
+        return False
+
+    current = install_path.resolve() if install_path.is_symlink() else None
+    previous_link = store_path / "previous"
+    previous = previous_link.resolve() if previous_link.is_symlink() else None
+
+    # Inode -> (size, versions using it), so shared files are counted once
+    inodes = {}
+    versions = []
+    for item in sorted(versions_dir.iterdir(), key=lambda item: item.stat().st_mtime):
+        if item.name.startswith(".") or not item.is_dir():
+            continue
+        size = 0
+        for root, _, names in os.walk(item):
+            for name in names:
+                info = os.lstat(os.path.join(root, name))
+                size += info.st_size
+                inodes.setdefault((info.st_dev, info.st_ino), [info.st_size, set()])[1].add(item.name)
+        versions.append((item, size))
+
+    print(f"Versions in {versions_dir}:")
+    for item, size in versions:
+        own = sum(entry[0] for entry in inodes.values() if entry[1] == {item.name})
+        is_current = item.resolve() == current
+        label = " (current)" if is_current else " (previous)" if item.resolve() == previous else ""
+        print(
+            f"  {'*' if is_current else ' '} {item.name:<20} "
+            f"{size / 1024 / 1024:>8.2f} MB, {own / 1024 / 1024:.2f} MB not shared{label}"
+        )
+
+    on_disk = sum(entry[0] for entry in inodes.values())
+    total = sum(size for _, size in versions)
+    print(f"{len(versions)} versions use {on_disk / 1024 / 1024:.2f} MB ({total / 1024 / 1024:.2f} MB without sharing)")
+    return True
+
+
+def rollback(install_path):
+    """Switch back to the previously installed version"""
+    previous_link = get_store_path(install_path) / "previous"
+    if not previous_link.is_symlink() or not previous_link.resolve().is_dir():
+        print("Error: No previous version to roll back to")
+        return False
+
+    previous_dir = previous_link.resolve()
+    current_dir = install_path.resolve() if install_path.is_symlink() else None
+
+    point_symlink(install_path, previous_dir)
+    if current_dir and current_dir.exists():
+        point_symlink(previous_link, current_dir)
+
+    version = get_current_version(install_path) or previous_dir.name
+    print(f"✓ Rolled back {install_path} to {version}")
+    return True
@@ -0,0 +1,145 @@
+"""
+Single-flight locks between concurrent runs, and the work directories they guard
+
+Two dl-jadx runs at once (two terminals, parallel chezmoi applies) used to
+write the same /tmp file and replace the same install path. Now every
+install holds an flock keyed by its install path, and every download one
+keyed by its artifact. A run that finds a lock taken waits for it and then
+looks at what the other run produced: an install that is already current,
+an artifact that is now in the cache, a file that is already in place.
+
+The kernel releases an flock when its holder exits, however it exits, so
+a lock can never go stale. The lock files themselves stay behind in
+${XDG_CACHE_HOME:-~/.cache}/dl-tools/locks/: they are empty apart from a
+note about the holder, and deleting a lock file another run may be about
+to lock would break the mutual exclusion.
+"""
+
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+from pathlib import Path
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows; runs aren't coordinated there
+    fcntl = None
+
+from .cache import get_cache_dir
+
+
+# Seconds to wait for another run before giving up
+DEFAULT_LOCK_TIMEOUT = 600
+
+LOCK_POLL_INTERVAL = 0.2
+
+# Work directories nobody touched for this long are left over from old runs
+WORK_DIR_MAX_AGE = 7 * 86400
+
+
+class LockTimeoutError(Exception):
+    """Another run held a lock for longer than the timeout"""
+
+
+def get_lock_name(kind, key):
+    return f"{kind}-{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}"
+
+
+def describe_holder(f):
+    """Describe the run holding a lock from the note it left in the lock file"""
+    try:
+        f.seek(0)
+        pid, started, what = f.read().split(" ", 2)
+        return f"pid {pid}, {what.strip()} for {time.time() - float(started):.0f}s"
+    except ValueError:
+        return "another run"
+
+
+@contextmanager
+def single_flight(kind, key, timeout=DEFAULT_LOCK_TIMEOUT, what=""):
+    """
+    Hold the lock for (kind, key), shared by all processes and threads.
+
+    Args:
+        kind: Lock namespace, e.g. "install" or "artifact"
+        key: What the lock protects, e.g. an absolute path or a digest
+        timeout: Seconds to wait for another holder; 0 fails at once
+        what: Description of the locked operation for the holder note
+
+    Yields:
+        True if another run held the lock and this one waited for it, in
+        which case the caller should first check what that run left behind
+
+    Raises:
+        LockTimeoutError
+    """
+    lock_dir = get_cache_dir() / "locks"
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    waited = False
+
+    with open(lock_dir / f"{get_lock_name(kind, key)}.lock", "a+") as f:
+        if fcntl is not None:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if not waited:
+                        print(f"Waiting for another run ({describe_holder(f)})...")
+                        waited = True
+                    if time.monotonic() >= deadline:
+                        raise LockTimeoutError(
+                            f"Gave up after waiting {timeout}s for another run ({describe_holder(f)}), "
+                            "see --lock-timeout"
+                        )
+                    time.sleep(LOCK_POLL_INTERVAL)
+
+            f.seek(0)
+            f.truncate()
+            f.write(f"{os.getpid()} {time.time():.0f} {what or kind}\n")
+            f.flush()
+
+        # Closing the file releases the lock
+        yield waited
+
+
+def get_work_dir(key):
+    """
+    Get the work directory of an artifact download.
+
+    It is private to the user and stable per artifact, so an interrupted
+    download resumes on the next run; only the holder of the artifact's
+    single_flight() lock may use it. Directories of other artifacts that
+    haven't been touched for WORK_DIR_MAX_AGE are removed on the way.
+    """
+    root = Path(tempfile.gettempdir()) / f"dl-tools-{os.getuid() if hasattr(os, 'getuid') else 'user'}"
+    try:
+        root.mkdir(mode=0o700, exist_ok=True)
+        info = root.lstat()
+        if root.is_symlink() or (hasattr(os, "getuid") and info.st_uid != os.getuid()):
+            raise PermissionError(f"{root} is not a private directory")
+    except OSError as e:
+        # Someone else owns the shared name: fall back to a directory for this run only
+        print(f"Warning: {e}, downloading into a temporary directory")
+        return Path(tempfile.mkdtemp(prefix="dl-tools-"))
+
+    name = get_lock_name("artifact", key)
+    now = time.time()
+    for item in root.iterdir():
+        if item.name == name or not item.is_dir():
+            continue
+        try:
+            newest = max([item.stat().st_mtime] + [child.stat().st_mtime for child in item.iterdir()])
+        except OSError:
+            continue
+        if now - newest > WORK_DIR_MAX_AGE:
+            shutil.rmtree(item, ignore_errors=True)
+
+    work_dir = root / name
+    work_dir.mkdir(mode=0o700, exist_ok=True)
+    return work_dir
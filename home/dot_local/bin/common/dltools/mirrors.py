@@ -0,0 +1,258 @@
+"""
+Picking the fastest of several download routes, and hedging chunks against stalls
+
+A route is one URL serving the same file: the original download URL, or a
+mirror derived from it (an internal mirror, a caching proxy of GitHub).
+probe_routes() fetches the first PROBE_SIZE bytes from every route at once
+and ranks them by time to first byte and throughput. HedgedFetcher then
+fetches the file chunk by chunk from the best route; a chunk that takes
+much longer than the probe predicts is requested again from the next
+route, and whichever copy arrives first is used.
+
+Mirrors are not trusted: a mirror route is only for files whose SHA-256
+is known beforehand, and the caller checks the digest of the result.
+"""
+
+import time
+import threading
+from urllib.parse import urlsplit
+from urllib.request import Request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .httppool import urlopen
+from .throttle import get_rate_limit
+
+
+# Bytes fetched from every route to rank them
+PROBE_SIZE = 256 * 1024
+PROBE_TIMEOUT = 10
+
+# Unit of a mirrored download; each chunk is held in memory until it is complete
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# A chunk is hedged once it takes HEDGE_FACTOR times its predicted time, but no sooner than MIN_HEDGE_DELAY
+HEDGE_FACTOR = 3
+MIN_HEDGE_DELAY = 2.0
+
+# Seconds without any data after which a request is given up
+STALL_TIMEOUT = 30
+
+READ_SIZE = 256 * 1024
+
+# Mirrors get no credentials meant for GitHub
+MIRROR_HEADERS = {"User-Agent": "dl-tools"}
+
+
+class ChunkError(Exception):
+    """A route didn't deliver a chunk"""
+
+
+def expand_mirrors(templates, url):
+    """
+    Turn mirror templates into the URLs of one file.
+
+    A template may use {url} (the original URL), {path} (its path without
+    the leading slash) and {name} (the file name). A template without any
+    of these is a base URL the original path is appended to, e.g.
+    "https://mirror.example/github" for
+    https://github.com/skylot/jadx/releases/download/v1.5.3/jadx-1.5.3.zip
+    gives https://mirror.example/github/skylot/jadx/releases/download/v1.5.3/jadx-1.5.3.zip.
+    """
+    path = urlsplit(url).path.lstrip("/")
+    fields = {"url": url, "path": path, "name": path.rsplit("/", 1)[-1]}
+    urls = []
+    for template in templates:
+        if "{" in template:
+            urls.append(template.format(**fields))
+        else:
+            urls.append(f"{template.rstrip('/')}/{path}")
+    return urls
+
+
+def get_route_label(url):
+    return urlsplit(url).netloc or url
+
+
+def probe_route(url, headers, expected_size):
+    """
+    Fetch the first PROBE_SIZE bytes of a route and time it.
+
+    Returns:
+        Route dict with url (after redirects), headers, label, ttfb (s),
+        rate (bytes/s) and size, or None if the route doesn't serve the
+        file with byte ranges
+    """
+    label = get_route_label(url)
+    request_headers = dict(headers)
+    request_headers["Range"] = f"bytes=0-{PROBE_SIZE - 1}"
+    started = time.monotonic()
+    try:
+        with urlopen(Request(url, headers=request_headers), timeout=PROBE_TIMEOUT) as response:
+            ttfb = time.monotonic() - started
+            if response.status != 206:
+                print(f"  {label}: no byte ranges, skipped")
+                return None
+            size = int(response.headers.get("Content-Range", "").rpartition("/")[2] or 0)
+            if size <= 0 or (expected_size > 0 and size != expected_size):
+                print(f"  {label}: size {size} doesn't match {expected_size}, skipped")
+                return None
+
+            received = 0
+            while True:
+                data = response.read(READ_SIZE)
+                if not data:
+                    break
+                received += len(data)
+            final_url = response.geturl()
+    except Exception as e:
+        print(f"  {label}: {e}, skipped")
+        return None
+
+    elapsed = time.monotonic() - started
+    rate = received / max(elapsed - ttfb, 0.001)
+    print(f"  {label}: first byte after {ttfb * 1000:.0f} ms, {rate / 1024 / 1024:.2f} MB/s")
+    return {"url": final_url, "headers": headers, "label": label, "ttfb": ttfb, "rate": rate, "size": size}
+
+
+def probe_routes(routes, expected_size):
+    """
+    Probe all routes at once.
+
+    Args:
+        routes: List of (url, headers)
+
+    Returns:
+        Usable route dicts, fastest first by predicted time for the whole file
+    """
+    print(f"Probing {len(routes)} download routes...")
+    with ThreadPoolExecutor(max_workers=len(routes)) as executor:
+        probed = list(executor.map(lambda route: probe_route(route[0], route[1], expected_size), routes))
+    usable = [route for route in probed if route is not None]
+    usable.sort(key=lambda route: route["ttfb"] + route["size"] / route["rate"])
+    return usable
+
+
+class HedgedFetcher:
+    """
+    Fetches byte ranges of a file from the best of several routes.
+
+    The order of the routes changes as they perform: a route whose hedge
+    wins moves to the front, a route that fails moves to the back.
+    """
+
+    def __init__(self, routes, max_requests):
+        self.routes = list(routes)
+        self.lock = threading.Lock()
+        self.active = 0
+        # Stalled requests hold a thread until they are aborted
+        self.executor = ThreadPoolExecutor(max_workers=max_requests)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def move(self, route, front):
+        with self.lock:
+            if route in self.routes:
+                self.routes.remove(route)
+                self.routes.insert(0 if front else len(self.routes), route)
+
+    def fetch_from(self, route, start, end, race):
+        """Fetch [start, end] from one route into memory; None if the race was decided meanwhile"""
+        headers = dict(route["headers"])
+        headers["Range"] = f"bytes={start}-{end}"
+        data = bytearray(end - start + 1)
+        view = memoryview(data)
+        position = 0
+        response = urlopen(Request(route["url"], headers=headers), timeout=STALL_TIMEOUT)
+        with race["lock"]:
+            if race["done"].is_set():
+                response.close()
+                return None
+            race["responses"].append(response)
+        try:
+            if response.status != 206:
+                raise ChunkError(f"{route['label']} answered a range request with HTTP {response.status}")
+            if not response.headers.get("Content-Range", "").replace(" ", "").startswith(f"bytes{start}-{end}/"):
+                raise ChunkError(f"{route['label']} sent the wrong range")
+            while position < len(data) and not race["done"].is_set():
+                size = response.readinto(view[position:position + READ_SIZE])
+                if not size:
+                    break
+                position += size
+        finally:
+            # Once the connection is back in the pool it must not be aborted any more
+            with race["lock"]:
+                race["responses"].remove(response)
+            response.close()
+
+        if race["done"].is_set():
+            return None
+        if position != len(data):
+            raise ChunkError(f"{route['label']} sent {position} of {len(data)} bytes")
+        return data
+
+    def fetch(self, start, end):
+        """
+        Fetch [start, end] from the best route, hedging on the next one if it stalls.
+
+        Returns:
+            bytearray with the range
+
+        Raises:
+            ChunkError (or a network error) if every route failed
+        """
+        with self.lock:
+            routes = list(self.routes)
+            self.active += 1
+            active = self.active
+        try:
+            return self.race(routes, start, end, active)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def race(self, routes, start, end, active):
+        """Body of fetch(); active is the number of chunks being fetched at once"""
+        primary = routes[0]
+        race = {"done": threading.Event(), "lock": threading.Lock(), "responses": []}
+        futures = {self.executor.submit(self.fetch_from, primary, start, end, race): primary}
+        untried = routes[1:]
+
+        # Under a rate limit the chunks share it, a slow chunk doesn't mean a slow route
+        rate = primary["rate"]
+        if get_rate_limit():
+            rate = min(rate, get_rate_limit() / active)
+        predicted = primary["ttfb"] + (end - start + 1) / rate
+        done, _ = wait(futures, timeout=max(MIN_HEDGE_DELAY, HEDGE_FACTOR * predicted))
+        if not done and untried:
+            route = untried.pop(0)
+            print(f"\nChunk at {start / 1024 / 1024:.0f} MB stalled on {primary['label']}, hedging on {route['label']}")
+            futures[self.executor.submit(self.fetch_from, route, start, end, race)] = route
+
+        errors = []
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    route = futures[future]
+                    if future.exception() is None and future.result() is not None:
+                        if route is not primary:
+                            self.move(route, front=True)
+                        return future.result()
+
+                    errors.append(future.exception() or ChunkError(f"{route['label']} delivered nothing"))
+                    print(f"\nChunk at {start / 1024 / 1024:.0f} MB failed on {route['label']}: {errors[-1]}")
+                    self.move(route, front=False)
+                    if untried:
+                        route = untried.pop(0)
+                        new_future = self.executor.submit(self.fetch_from, route, start, end, race)
+                        futures[new_future] = route
+                        pending.add(new_future)
+        finally:
+            # Losing requests stop at once instead of running into the stall timeout
+            with race["lock"]:
+                race["done"].set()
+                for response in race["responses"]:
+                    response.abort()
+        raise errors[0]
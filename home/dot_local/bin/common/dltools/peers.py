@@ -0,0 +1,291 @@
+"""
+LAN peer cache: serve the local caches over HTTP and fetch artifacts from other hosts
+
+dl-tools --serve-cache exposes the artifact cache and the cached metadata
+responses of this host read-only:
+
+    /artifacts/<cache key>   a verified artifact, with byte ranges
+    /metadata/<key>          a cached release info or list.js body, as received
+    /index.json              what is there
+
+A host given --peer URL asks the peers for an artifact by its cache key
+before going to the origin. What a peer sends is checked like a download
+from the origin: the size against the release info or list.js, and the
+SHA-256 against GitHub's digest. 52pojie lists no digest, so a peer could
+hand out a different file of the same size; only name hosts you trust.
+"""
+
+import os
+import re
+import json
+import socket
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from urllib.request import Request
+from urllib.error import URLError, HTTPError
+
+from .cache import get_artifact_path, get_cache_dir, get_metadata_cache_paths_by_key, get_temp_suffix
+from .download import discard_partial, download_file
+from .httppool import urlopen
+
+
+DEFAULT_SERVE_PORT = 8741
+
+# A peer that doesn't answer this quickly is skipped
+PEER_TIMEOUT = 3
+
+ARTIFACT_PATH = re.compile(r"^/artifacts/((?:sha256|url)-[0-9a-f]{64})$")
+METADATA_PATH = re.compile(r"^/metadata/([0-9a-f]{32})$")
+RANGE_HEADER = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+SEND_SIZE = 1024 * 1024
+
+
+def get_peer_url(peer, cache_key):
+    """Get the URL of an artifact on a peer"""
+    return f"{peer.rstrip('/')}/artifacts/{cache_key}"
+
+
+def get_peer_size(url):
+    """
+    Ask a peer whether it has an artifact.
+
+    Returns:
+        Size of the artifact in bytes, or None if the peer doesn't have it
+        or can't be reached
+    """
+    label = urlsplit(url).netloc or url
+    try:
+        with urlopen(Request(url, method="HEAD"), timeout=PEER_TIMEOUT) as response:
+            return int(response.headers.get("Content-Length", ""))
+    except HTTPError as e:
+        if e.code != 404:
+            print(f"Peer {label}: HTTP {e.code}")
+    except (URLError, OSError, ValueError) as e:
+        print(f"Peer {label}: {e}")
+    return None
+
+
+def fetch_from_peers(peers, cache_key, dest_path, filename, expected_size, expected_sha256=None, segments=1):
+    """
+    Download an artifact from the first peer that has it.
+
+    Args:
+        peers: Base URLs of hosts running --serve-cache
+        cache_key: Cache key of the artifact, see dltools.cache
+        expected_size: Size from the origin's metadata
+        expected_sha256: Hex digest from the origin's metadata, if it has one
+
+    Returns:
+        SHA-256 hex digest of the file at dest_path, or None if no peer
+        delivered a file that matches
+    """
+    for peer in peers:
+        url = get_peer_url(peer, cache_key)
+        size = get_peer_size(url)
+        if size is None:
+            continue
+        label = urlsplit(url).netloc or url
+        if expected_size > 0 and size != expected_size:
+            print(f"Peer {label} has {filename} with {size} bytes instead of {expected_size}, skipped")
+            continue
+
+        print(f"Fetching {filename} from peer {label}")
+        # Not into dest_path: its .part may be a resumable download from the
+        # origin, which download_file would start over for a different URL
+        tmp_path = dest_path.with_name(f".{dest_path.name}.{get_temp_suffix()}")
+        try:
+            actual_sha256 = download_file(url, tmp_path, filename, size, segments=segments, retries=1)
+            if not actual_sha256:
+                continue
+            if tmp_path.stat().st_size != size or (expected_sha256 and actual_sha256 != expected_sha256.lower()):
+                print(f"Error: {filename} from peer {label} doesn't match the origin's metadata, discarded")
+                continue
+            os.replace(tmp_path, dest_path)
+            return actual_sha256
+        except OSError as e:
+            print(f"Peer {label}: {e}")
+        finally:
+            discard_partial(tmp_path)
+            if tmp_path.exists():
+                tmp_path.unlink()
+    return None
+
+
+def list_cache():
+    """List the artifacts and metadata responses a --serve-cache host offers"""
+    artifacts = []
+    artifacts_dir = get_cache_dir() / "artifacts"
+    if artifacts_dir.is_dir():
+        for path in sorted(artifacts_dir.iterdir()):
+            if ARTIFACT_PATH.match(f"/artifacts/{path.name}") and path.is_file():
+                artifacts.append({"key": path.name, "size": path.stat().st_size})
+
+    metadata = []
+    metadata_dir = get_cache_dir() / "metadata"
+    if metadata_dir.is_dir():
+        for path in sorted(metadata_dir.glob("*.json")):
+            try:
+                metadata.append({"key": path.stem, "url": json.loads(path.read_text())["url"]})
+            except (OSError, ValueError, KeyError):
+                continue
+    return {"artifacts": artifacts, "metadata": metadata}
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    """Read-only view of the local caches, see the module docstring"""
+
+    server_version = "dl-tools"
+    # Keep-alive, so peers fetching several segments reuse their connections
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def handle_request(self, send_body):
+        path = urlsplit(self.path).path
+        match = ARTIFACT_PATH.match(path)
+        if match:
+            self.send_artifact(match.group(1), send_body)
+            return
+        match = METADATA_PATH.match(path)
+        if match:
+            self.send_metadata(match.group(1), send_body)
+            return
+        if path in ("/", "/index.json"):
+            body = json.dumps(list_cache(), indent=2).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if send_body:
+                self.wfile.write(body)
+            return
+        self.send_error(404)
+
+    def get_range(self, size):
+        """
+        Pick the byte range to send from the Range and If-Range headers.
+
+        Returns:
+            Tuple (start, end) of a satisfiable range, None for the whole
+            file, or False if the range can't be satisfied
+        """
+        match = RANGE_HEADER.match(self.headers.get("Range", "").replace(" ", ""))
+        if not match or not any(match.groups()):
+            # No range, or several of them: the whole file is a valid answer
+            return None
+        if_range = self.headers.get("If-Range")
+        if if_range and if_range != self.get_etag():
+            return None
+
+        first, last = match.groups()
+        if not first:
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if start > end or start >= size:
+            return False
+        return start, end
+
+    def get_etag(self):
+        # Cache keys name the content, so the key is a strong validator
+        return f'"{urlsplit(self.path).path.rsplit("/", 1)[-1]}"'
+
+    def send_artifact(self, cache_key, send_body):
+        path = get_artifact_path(cache_key)
+        try:
+            f = open(path, "rb")
+        except OSError:
+            self.send_error(404)
+            return
+
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            byte_range = self.get_range(size)
+            if byte_range is False:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            start, end = byte_range or (0, size - 1)
+            self.send_response(206 if byte_range else 200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", self.get_etag())
+            if byte_range:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+            if not send_body:
+                return
+
+            # Serving an artifact counts as a use for the LRU eviction
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = f.read(min(SEND_SIZE, remaining))
+                if not data:
+                    break
+                self.wfile.write(data)
+                remaining -= len(data)
+
+    def send_metadata(self, key, send_body):
+        meta_path, body_path = get_metadata_cache_paths_by_key(key)
+        try:
+            meta = json.loads(meta_path.read_text())
+            body = body_path.read_bytes()
+        except (OSError, ValueError):
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Content-Location", meta.get("url", ""))
+        if meta.get("content_encoding"):
+            self.send_header("Content-Encoding", meta["content_encoding"])
+        if meta.get("etag"):
+            self.send_header("ETag", meta["etag"])
+        if meta.get("last_modified"):
+            self.send_header("Last-Modified", meta["last_modified"])
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} {format % args}")
+
+
+def parse_address(value):
+    """Split a --serve-cache value of the form [HOST:]PORT"""
+    host, _, port = value.rpartition(":")
+    return host.strip("[]"), int(port)
+
+
+def serve_cache(address):
+    """
+    Serve the local caches to peers until interrupted.
+
+    Args:
+        address: "[HOST:]PORT"; without a host, all interfaces are used
+    """
+    host, port = parse_address(address)
+    server = ThreadingHTTPServer((host, port), CacheRequestHandler)
+    server.daemon_threads = True
+    print(f"Serving {get_cache_dir()} on http://{host or socket.gethostname()}:{port}/ (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped")
+    finally:
+        server.server_close()
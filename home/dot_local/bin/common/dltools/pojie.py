@@ -0,0 +1,651 @@
+"""
+File listing of down.52pojie.cn: streaming list.js parser, path index and pattern queries
+"""
+
+import os
+import re
+import json
+import codecs
+import itertools
+import threading
+from urllib.parse import urlparse
+from urllib.request import Request
+from urllib.error import URLError, HTTPError
+
+try:
+    import sqlite3
+except ImportError:
+    # Some minimal Python builds ship without sqlite3; the path index is skipped then
+    sqlite3 = None
+
+from .cache import get_cache_dir, get_metadata_cache_paths, refresh_metadata
+from .decoders import DEFAULT_CHUNK_SIZE, decode_chunks, get_accept_encoding
+from .events import span
+from .httppool import urlopen
+
+
+# DL_TOOLS_52POJIE_URL points the tools at a mirror or a local stand-in
+DOWNLOAD_BASE_URL = os.environ.get("DL_TOOLS_52POJIE_URL", "https://down.52pojie.cn").rstrip("/")
+LIST_URL = DOWNLOAD_BASE_URL + "/list.js"
+
+# Pattern of the JEB demo releases, used when no pattern is given
+DEFAULT_PATTERN = r"/Tools/Android_Tools/JEB_demo_([\d.]+)_by_CXV"
+
+
+def get_list_headers():
+    """Get the browser-like headers down.52pojie.cn expects for list.js"""
+    return {
+        "Accept": "*/*",
+        "Accept-Encoding": get_accept_encoding(),
+        "Accept-Language": "zh-CN,zh;q=0.9",
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "Host": urlparse(DOWNLOAD_BASE_URL).netloc,
+        "Pragma": "no-cache",
+        "Referer": f"{DOWNLOAD_BASE_URL}/Tools/Android_Tools/",
+        "Sec-Fetch-Dest": "script",
+        "Sec-Fetch-Mode": "no-cors",
+        "Sec-Fetch-Site": "same-origin",
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Safari/537.36",
+        "sec-ch-ua": '"Google Chrome";v="143", "Chromium";v="143", "Not A(Brand";v="24"',
+        "sec-ch-ua-mobile": "?0",
+        "sec-ch-ua-platform": '"macOS"',
+    }
+
+
+# Decodes the JSON value at an offset of a string, in C where available
+scan_json_value = json.JSONDecoder().scan_once
+JSON_WHITESPACE = " \t\n\r"
+
+# Largest run of files the scanner decodes in one call, in characters
+MAX_LEAF_BATCH = 1024 * 1024
+
+
+def iter_list_text(stream, content_encoding=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Decode a list.js response incrementally.
+
+    The body is decoded chunk by chunk according to its Content-Encoding;
+    without one, gzip is still detected from the magic bytes, as before.
+    The __jsonpCallbackDown52PojieCn( wrapper is stripped from the front
+    on the fly.
+
+    Yields:
+        Text chunks of the JSON document
+    """
+    raw_chunks = iter(lambda: stream.read(chunk_size), b"")
+
+    if content_encoding is None:
+        head = b""
+        for data in raw_chunks:
+            head += data
+            if len(head) >= 2:
+                break
+        raw_chunks = itertools.chain([head], raw_chunks)
+        # Gzip magic number is 1f 8b
+        if head[:2] == b"\x1f\x8b":
+            content_encoding = "gzip"
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def decoded_chunks():
+        for data in decode_chunks(raw_chunks, content_encoding, chunk_size):
+            yield decoder.decode(data)
+        yield decoder.decode(b"", final=True)
+
+    # Format: __jsonpCallbackDown52PojieCn({...});
+    prefix = ""
+    chunks = decoded_chunks()
+    for text in chunks:
+        prefix += text
+        if "(" in prefix:
+            break
+        if len(prefix) > 1024:
+            break
+
+    callback, _, rest = prefix.partition("(")
+    if callback.strip() != "__jsonpCallbackDown52PojieCn" or not _:
+        raise ValueError("Could not parse JSONP response")
+
+    yield rest
+    yield from chunks
+
+
+class ListScanner:
+    """
+    Cursor over the JSON text of list.js, pulled in chunk by chunk.
+
+    Values are decoded by the json module's scanner straight out of the
+    buffer. Text behind the cursor is dropped whenever a chunk is added,
+    so the buffer stays around the size of a chunk plus the value being
+    decoded.
+    """
+
+    def __init__(self, text_chunks):
+        self.chunks = iter(text_chunks)
+        self.buffer = ""
+        self.pos = 0
+        self.final = False
+
+    def fill(self):
+        """Add the next chunk to the buffer; False at the end of the document"""
+        for text in self.chunks:
+            if text:
+                self.buffer = self.buffer[self.pos:] + text
+                self.pos = 0
+                return True
+        self.final = True
+        return False
+
+    def peek(self):
+        """Skip whitespace and get the character at the cursor, "" at the end"""
+        while True:
+            buffer, pos = self.buffer, self.pos
+            length = len(buffer)
+            while pos < length and buffer[pos] in JSON_WHITESPACE:
+                pos += 1
+            self.pos = pos
+            if pos < length:
+                return buffer[pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars):
+        """Move past the character at the cursor, which must be one of chars, and return it"""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Invalid JSON near: {self.buffer[self.pos:self.pos + 40]!r}")
+        self.pos += 1
+        return char
+
+    def read_value(self):
+        """Decode the JSON value at the cursor and move past it"""
+        self.peek()
+        while True:
+            try:
+                value, end = scan_json_value(self.buffer, self.pos)
+                # A number at the end of the buffer may go on in the next chunk
+                if end < len(self.buffer) or self.final:
+                    self.pos = end
+                    return value
+            except (StopIteration, ValueError):
+                # Most likely the value is cut off at the end of the buffer
+                if self.final:
+                    raise ValueError(f"Invalid JSON near: {self.buffer[self.pos:self.pos + 40]!r}")
+            self.fill()
+
+    def leaves_ahead(self):
+        """
+        Check whether the array or object at the cursor has no arrays in it.
+
+        That is the case for a file node and a directory holding only
+        files, which read_value() then decodes in one go. A bracket inside
+        a name only makes this answer False, taking the slower path; a
+        closing one can make it answer True for a directory, whose subtree
+        is then decoded as a whole, which is still correct.
+        """
+        closing_char = "]" if self.peek() == "[" else "}"
+        while True:
+            buffer, pos = self.buffer, self.pos
+            closing = buffer.find(closing_char, pos + 1)
+            end = closing if closing >= 0 else len(buffer)
+            if buffer.find("[", pos + 1, end) >= 0:
+                return False
+            if closing >= 0:
+                return True
+            if end - pos > MAX_LEAF_BATCH or not self.fill():
+                return False
+
+    def skip_array(self):
+        """
+        Move past the array at the cursor without decoding it.
+
+        The brackets are located with str.find. Names may contain brackets
+        too, so one only counts if an even number of quotes lies between it
+        and the cursor, which is always outside of strings.
+        """
+        self.expect("[")
+        depth = 1
+        while True:
+            buffer, pos = self.buffer, self.pos
+            opening = buffer.find("[", pos)
+            closing = buffer.find("]", pos)
+            end = closing if closing >= 0 else len(buffer)
+            if 0 <= opening < end:
+                end = opening
+
+            if buffer.find('\\"', pos, end) >= 0:
+                # Escaped quotes break the count: step over the next string instead
+                self.pos = buffer.find('"', pos, end)
+                self.read_value()
+            elif buffer.count('"', pos, end) % 2:
+                # end is inside a string, which starts at the last quote before it
+                self.pos = buffer.rfind('"', pos, end)
+                self.read_value()
+            elif end == len(buffer):
+                self.pos = end
+                if not self.fill():
+                    raise ValueError("Invalid JSON: unterminated array")
+            else:
+                self.pos = end + 1
+                depth += 1 if buffer[end] == "[" else -1
+                if not depth:
+                    return
+
+
+def iter_tree_nodes(stream, prefix=None, content_encoding=None):
+    """
+    Stream index rows out of a list.js response without building the tree.
+
+    The decoding is left to the C scanner of the json module: a directory
+    holding only files is decoded in one call, other nodes key by key, and
+    subtrees outside the prefix are skipped by looking for their brackets
+    with str.find, so only a handful of Python steps are spent per node.
+
+    Args:
+        stream: Binary file-like object with the raw (possibly compressed) list.js
+        prefix: Optional list of path segments; only nodes whose names start
+            with the segment at their depth (like re.match of a literal
+            pattern) are yielded, and other subtrees are skipped unparsed
+        content_encoding: Content-Encoding of the body, None to detect gzip
+
+    Yields:
+        Tuples (path, parent, name, is_dir, size, time)
+    """
+    scanner = ListScanner(iter_list_text(stream, content_encoding))
+    prefix = prefix or []
+
+    def wanted(depth, node_name):
+        return depth > len(prefix) or node_name.startswith(prefix[depth - 1])
+
+    def decoded_rows(nodes, parent_path, depth, rows):
+        # Nodes the scanner decoded as a whole, with everything below them
+        prefix_segment = prefix[depth - 1] if depth <= len(prefix) else ""
+        for node in nodes:
+            node_name = node.get("name", "")
+            if not node_name.startswith(prefix_segment):
+                continue
+            node_path = parent_path + "/" + node_name
+            children = node.get("children")
+            rows.append((node_path, parent_path, node_name, int(children is not None), node.get("size", 0), node.get("time", 0)))
+            if children:
+                decoded_rows(children, node_path, depth + 1, rows)
+        return rows
+
+    # The parsers yield lists of rows, so a row isn't passed up through every level of the tree
+    def parse_children(node_path, depth):
+        if scanner.peek() != "[":
+            raise ValueError("Expected a children array")
+        if scanner.leaves_ahead():
+            yield decoded_rows(scanner.read_value(), node_path, depth, [])
+            return
+        scanner.pos += 1
+        if scanner.peek() == "]":
+            scanner.pos += 1
+            return
+        while True:
+            if scanner.peek() != "{":
+                raise ValueError("Expected a node object")
+            if scanner.leaves_ahead():
+                yield decoded_rows((scanner.read_value(),), node_path, depth, [])
+            else:
+                yield from parse_node(node_path, depth)
+            if scanner.expect(",]") == "]":
+                return
+
+    def parse_node(parent_path, depth):
+        # depth 0 is the root, whose children hang off the empty path
+        node_name = None
+        size = 0
+        modified_time = 0
+        is_dir = False
+        pending_children = None
+
+        scanner.expect("{")
+        if scanner.peek() == "}":
+            scanner.pos += 1
+        else:
+            while True:
+                key = scanner.read_value()
+                scanner.expect(":")
+                if key == "children" and scanner.peek() == "[":
+                    is_dir = True
+                    if depth == 0:
+                        yield from parse_children("", 1)
+                    elif node_name is None:
+                        pending_children = scanner.read_value()
+                    elif wanted(depth, node_name):
+                        yield from parse_children(parent_path + "/" + node_name, depth + 1)
+                    else:
+                        scanner.skip_array()
+                else:
+                    value = scanner.read_value()
+                    if key == "name":
+                        node_name = value
+                    elif key == "size":
+                        size = value
+                    elif key == "time":
+                        modified_time = value
+                if scanner.expect(",}") == "}":
+                    break
+
+        if depth == 0:
+            return
+        node_name = node_name or ""
+        if not wanted(depth, node_name):
+            return
+
+        node_path = parent_path + "/" + node_name
+        rows = [(node_path, parent_path, node_name, int(is_dir), size, modified_time)]
+        if pending_children is not None:
+            decoded_rows(pending_children, node_path, depth + 1, rows)
+        yield rows
+
+    if scanner.peek() != "{":
+        raise ValueError("Expected the root object")
+    for rows in parse_node("", 0):
+        yield from rows
+
+
+def load_file_tree(stream, prefix=None, content_encoding=None):
+    """
+    Build an in-memory parent -> children map from a list.js stream.
+
+    Only nodes under the literal path prefix are kept, so memory use is
+    bounded by the part of the listing that is actually queried.
+    """
+    tree = {}
+    for _, parent, node_name, is_dir, size, modified_time in iter_tree_nodes(stream, prefix, content_encoding):
+        tree.setdefault(parent, []).append((node_name, bool(is_dir), size, modified_time))
+    return tree
+
+
+def get_file_list(prefix=None, ttl=0, use_cache=True):
+    """
+    Fetch and parse the list.js file from 52pojie.cn.
+
+    The raw response goes through the metadata cache, so an unchanged
+    list.js is revalidated with a 304 instead of downloaded again, or
+    within ttl seconds not requested at all. Either way it is parsed as a
+    stream, never held in memory as a whole.
+
+    Returns:
+        Dict mapping a directory path ("" for the root) to a list of
+        (name, is_dir, size, time) tuples of its children
+    """
+    if not use_cache:
+        with urlopen(Request(LIST_URL, headers=get_list_headers())) as response:
+            return load_file_tree(response, prefix, response.headers.get("Content-Encoding"))
+
+    meta = refresh_metadata(LIST_URL, get_list_headers(), ttl)
+    _, body_path = get_metadata_cache_paths(LIST_URL)
+    with open(body_path, "rb") as stream:
+        return load_file_tree(stream, prefix, meta.get("content_encoding"))
+
+
+def update_file_index(conn, nodes, digest):
+    """
+    Bring the index in line with a freshly parsed tree.
+
+    The rows are streamed into a temporary table first; only rows whose
+    type, size or time changed are then rewritten, and rows for paths that
+    disappeared from list.js are deleted.
+    """
+    with conn:
+        conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS incoming ("
+            "path TEXT PRIMARY KEY, parent TEXT NOT NULL, name TEXT NOT NULL, "
+            "is_dir INTEGER NOT NULL, size INTEGER, time INTEGER)"
+        )
+        conn.execute("DELETE FROM incoming")
+        conn.executemany("INSERT OR REPLACE INTO incoming VALUES (?, ?, ?, ?, ?, ?)", nodes)
+
+        changed = conn.execute(
+            "INSERT OR REPLACE INTO nodes SELECT * FROM incoming AS i WHERE NOT EXISTS ("
+            "SELECT 1 FROM nodes AS n WHERE n.path = i.path AND n.is_dir = i.is_dir "
+            "AND n.size IS i.size AND n.time IS i.time)"
+        ).rowcount
+        removed = conn.execute(
+            "DELETE FROM nodes WHERE path NOT IN (SELECT path FROM incoming)"
+        ).rowcount
+
+        conn.execute("DELETE FROM incoming")
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('list_digest', ?)", (digest,))
+
+    print(f"File index updated: {changed} changed, {removed} removed")
+
+
+def open_file_index(ttl=0):
+    """
+    Open the on-disk path index of the 52pojie tree, updating it if list.js changed.
+
+    The index is a SQLite table of path -> (size, time) kept next to the
+    metadata cache. It records the digest of the list.js it was built from,
+    so as long as list.js is unchanged (304, or within ttl) it is queried
+    directly without decompressing or parsing anything.
+
+    Returns:
+        sqlite3 connection, or None if the index is unavailable
+    """
+    if sqlite3 is None:
+        return None
+
+    meta = refresh_metadata(LIST_URL, get_list_headers(), ttl)
+    digest = meta.get("digest")
+
+    try:
+        index_path = get_cache_dir() / "52pojie-index.sqlite3"
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(index_path), timeout=30)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS nodes ("
+            "path TEXT PRIMARY KEY, parent TEXT NOT NULL, name TEXT NOT NULL, "
+            "is_dir INTEGER NOT NULL, size INTEGER, time INTEGER) WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS nodes_parent ON nodes (parent, name)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+        row = conn.execute("SELECT value FROM meta WHERE key = 'list_digest'").fetchone()
+        if digest and row and row[0] == digest:
+            print("File index is up to date")
+            return conn
+
+        print("Updating file index...")
+        _, body_path = get_metadata_cache_paths(LIST_URL)
+        with span("index_update") as record, open(body_path, "rb") as stream:
+            record["bytes"] = os.fstat(stream.fileno()).st_size
+            update_file_index(conn, iter_tree_nodes(stream, content_encoding=meta.get("content_encoding")), digest)
+        return conn
+
+    except sqlite3.Error as e:
+        print(f"Warning: File index unavailable: {e}")
+        return None
+
+
+# Several tools may query the listing at once; they share one index file
+_index_lock = threading.Lock()
+
+# Marker for the "**" segment, which matches any number of directories
+RECURSIVE_SEGMENT = "**"
+
+
+def compile_pattern(pattern, full_match=False):
+    """
+    Compile a path pattern into per-segment matchers, once per query.
+
+    Args:
+        pattern: Path pattern like "/Tools/Android_Tools/JEB_demo_([\\d.]+)_by_CXV";
+            every segment is a regex, "**" matches any number of directories,
+            or every file below when it is the last segment
+        full_match: Segments must match whole names instead of a prefix (re.match)
+
+    Returns:
+        List of (kind, value) steps: ("literal", name), ("regex", matcher)
+        or ("recursive", None)
+    """
+    steps = []
+    for segment in pattern.strip("/").split("/"):
+        if segment == RECURSIVE_SEGMENT:
+            # Consecutive "**" are the same as one
+            if not steps or steps[-1][0] != "recursive":
+                steps.append(("recursive", None))
+        elif re.escape(segment) == segment:
+            steps.append(("literal", segment))
+        else:
+            compiled = re.compile(segment)
+            steps.append(("regex", compiled.fullmatch if full_match else compiled.match))
+    return steps
+
+
+class IndexTreeSource:
+    """Directory listings answered from the SQLite path index"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def children(self, dir_path):
+        return self.conn.execute(
+            "SELECT name, is_dir, size, time FROM nodes WHERE parent = ?", (dir_path,)
+        ).fetchall()
+
+    def child(self, dir_path, name):
+        return self.conn.execute(
+            "SELECT name, is_dir, size, time FROM nodes WHERE parent = ? AND name = ?",
+            (dir_path, name),
+        ).fetchone()
+
+    def children_with_prefix(self, dir_path, prefix):
+        # Range scan on the (parent, name) index instead of a full listing
+        return self.conn.execute(
+            "SELECT name, is_dir, size, time FROM nodes "
+            "WHERE parent = ? AND name >= ? AND name < ?",
+            (dir_path, prefix, prefix + "\U0010ffff"),
+        ).fetchall()
+
+
+class MemoryTreeSource:
+    """Directory listings answered from a parsed parent -> children map"""
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.by_name = {}
+
+    def children(self, dir_path):
+        return self.tree.get(dir_path, [])
+
+    def child(self, dir_path, name):
+        if dir_path not in self.by_name:
+            self.by_name[dir_path] = {row[0]: row for row in self.children(dir_path)}
+        return self.by_name[dir_path].get(name)
+
+    def children_with_prefix(self, dir_path, prefix):
+        return [row for row in self.children(dir_path) if row[0].startswith(prefix)]
+
+
+def iter_matching_files(steps, source, full_match=False):
+    """
+    Walk the tree along the compiled steps.
+
+    Literal segments are direct name lookups (or a prefix range scan when
+    matching re.match-style), so only the directories on the way are
+    listed; "**" descends into every directory below, and at the end of
+    the pattern matches every file there.
+
+    Yields:
+        Tuples (file_url, filename, file_size, modified_time), lazily
+    """
+    seen = set()
+
+    def candidates(dir_path, step):
+        kind, value = step
+        if kind == "literal":
+            if full_match:
+                row = source.child(dir_path, value)
+                return [row] if row else []
+            return source.children_with_prefix(dir_path, value)
+        return [row for row in source.children(dir_path) if value(row[0])]
+
+    def walk(dir_path, index):
+        step = steps[index]
+
+        if step[0] == "recursive":
+            is_last = index == len(steps) - 1
+            # Zero directories...
+            if not is_last:
+                yield from walk(dir_path, index + 1)
+            # ...or one more, staying on the "**" step
+            for name, is_dir, size, modified_time in source.children(dir_path):
+                node_path = dir_path + "/" + name
+                if is_dir:
+                    yield from walk(node_path, index)
+                elif is_last and node_path not in seen:
+                    # A trailing "**" matches every file below
+                    seen.add(node_path)
+                    yield (DOWNLOAD_BASE_URL + node_path, name, size, modified_time)
+            return
+
+        is_last = index == len(steps) - 1
+        for name, is_dir, size, modified_time in candidates(dir_path, step):
+            node_path = dir_path + "/" + name
+            if is_last:
+                # The last segment matches files only
+                if not is_dir and node_path not in seen:
+                    seen.add(node_path)
+                    yield (DOWNLOAD_BASE_URL + node_path, name, size, modified_time)
+            elif is_dir:
+                yield from walk(node_path, index + 1)
+
+    if steps:
+        yield from walk("", 0)
+
+
+def find_files_by_pattern(
+    pattern, ttl=0, use_cache=True, use_index=True, full_match=False, limit=None
+):
+    """
+    Find files matching the given path pattern with regex support.
+
+    Args:
+        pattern: Path pattern like "/Tools/Android_Tools/JEB_demo_([\\d.]+)_by_CXV";
+            a "**" segment matches any number of directories
+        ttl: Freshness window of the cached list.js in seconds
+        use_cache: Go through the metadata cache for list.js
+        use_index: Answer from the on-disk path index instead of the parsed tree
+        full_match: Segments must match whole names instead of a prefix
+        limit: Stop after this many matches
+
+    Returns:
+        List of tuples: [(file_url, filename, file_size, modified_time), ...],
+        or None if the listing couldn't be fetched
+    """
+    steps = compile_pattern(pattern, full_match)
+
+    with _index_lock:
+        conn = None
+        try:
+            conn = open_file_index(ttl) if use_cache and use_index else None
+            if conn is not None:
+                source = IndexTreeSource(conn)
+            else:
+                # Leading literal segments prune the parse to their subtree
+                literal_prefix = []
+                for kind, value in steps:
+                    if kind != "literal":
+                        break
+                    literal_prefix.append(value)
+
+                # Get the file tree
+                source = MemoryTreeSource(get_file_list(literal_prefix, ttl, use_cache))
+
+            return list(itertools.islice(iter_matching_files(steps, source, full_match), limit))
+
+        except HTTPError as e:
+            print(f"HTTP Error: {e.code} - {e.reason}")
+        except URLError as e:
+            print(f"URL Error: {e.reason}")
+        except Exception as e:
+            print(f"Error fetching list data: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+    return None
@@ -0,0 +1,140 @@
+"""
+Background prefetch: stage new releases in the artifact cache ahead of an install
+
+dl-tools --prefetch runs the resolve step of every tool as usual, but
+instead of installing it downloads and verifies new artifacts into the
+artifact cache and stops there. The next interactive install then finds a
+cache hit and only has to extract and switch over. Meant to run from the
+systemd user timer next to the manifest or from cron, at idle priority.
+"""
+
+import os
+import time
+import random
+
+from .cache import DEFAULT_CACHE_MAX_SIZE, cache_store, get_artifact_path, get_cache_key
+from .engine import (
+    download_github_asset,
+    download_pojie_file,
+    get_asset_cache_key,
+    get_option,
+    resolve_github_tool,
+    resolve_pojie_tool,
+)
+from .locks import LockTimeoutError, get_work_dir, single_flight
+from .sync import get_sync_path
+
+
+def wait_jitter(jitter):
+    """Sleep for a random part of jitter seconds, so scheduled runs don't all poll at once"""
+    if jitter <= 0:
+        return
+    delay = random.uniform(0, jitter)
+    print(f"Waiting {delay:.0f}s before polling...")
+    time.sleep(delay)
+
+
+def stage_artifact(cache_key, lock_key, name, fetch, tool, args):
+    """
+    Download an artifact into the cache unless it is already there.
+
+    An install fetching the same artifact isn't waited for: it puts the
+    artifact where it's needed itself, so this run just leaves it alone.
+
+    Args:
+        lock_key: Key of the artifact lock the install step takes, so the
+            two exclude each other; a github install also resumes a partial
+            download left in the work directory under that key
+        fetch: Called with the work directory, returns the path of the
+            verified download or None
+
+    Returns:
+        True if the artifact is staged (or being staged), False otherwise
+    """
+    if get_artifact_path(cache_key).is_file():
+        print(f"{name} is already staged")
+        return True
+
+    try:
+        with single_flight("artifact", lock_key, 0, f"prefetching {name}"):
+            work_dir = get_work_dir(lock_key)
+            try:
+                path = fetch(work_dir)
+                if not path:
+                    return False
+                cache_max_size = get_option(tool, args, "cache_max_size", DEFAULT_CACHE_MAX_SIZE)
+                if not cache_store(path, cache_key, cache_max_size * 1024 * 1024, move=True):
+                    return False
+            finally:
+                if work_dir.exists() and not any(work_dir.iterdir()):
+                    work_dir.rmdir()
+    except LockTimeoutError:
+        print(f"Another run is fetching {name}, leaving it to that one")
+        return True
+
+    print(f"\n✓ Staged {name} in the artifact cache")
+    return True
+
+
+def prefetch_github_tool(plan, args):
+    """
+    Stage the release asset picked by resolve_github_tool() without installing it.
+
+    Returns:
+        True if successful, False otherwise
+    """
+    asset = plan["asset"]
+    cache_key = get_asset_cache_key(asset, args)
+    if cache_key is None:
+        print(f"Error: {asset['name']} can't be staged: the release lists no digest or the cache is disabled")
+        return False
+    return stage_artifact(
+        cache_key,
+        asset.get("digest") or asset["browser_download_url"],
+        f"{plan['tool']['name']} {plan['version']}",
+        lambda work_dir: download_github_asset(plan, args, work_dir),
+        plan["tool"],
+        args,
+    )
+
+
+def prefetch_pojie_tool(plan, args):
+    """
+    Stage the files picked by resolve_pojie_tool() that aren't in the target directory yet.
+
+    Returns:
+        True if successful, False otherwise
+    """
+    tool = plan["tool"]
+    if args.no_cache:
+        print("Error: Files can't be staged with the cache disabled")
+        return False
+
+    success = True
+    for file_url, filename, file_size, modified_time in plan["files"]:
+        output_path = plan["target_dir"] / filename
+        if get_option(tool, args, "sync", False):
+            output_path = get_sync_path(plan["target_dir"], file_url, plan["pattern"])
+            if output_path is None:
+                continue
+        if output_path.is_file() and output_path.stat().st_size == file_size:
+            print(f"{filename} is already in {output_path.parent}")
+            continue
+
+        def fetch(work_dir, file_url=file_url, filename=filename, file_size=file_size, modified_time=modified_time):
+            path = work_dir / filename
+            if not download_pojie_file(file_url, path, file_size, modified_time, tool, args):
+                return None
+            return path
+
+        cache_key = get_cache_key(file_url, file_size, modified_time)
+        if not stage_artifact(cache_key, os.path.abspath(output_path), filename, fetch, tool, args):
+            success = False
+    return success
+
+
+# Resolve and prefetch steps of each tool type, used by run_tools() in place of engine.TOOL_TYPES
+PREFETCH_TYPES = {
+    "github": (resolve_github_tool, prefetch_github_tool),
+    "52pojie": (resolve_pojie_tool, prefetch_pojie_tool),
+}
@@ -0,0 +1,203 @@
+"""
+Incremental upgrades that fetch only the zip members that changed
+
+The central directory at the end of a zip lists every member with its
+CRC-32, size and offset. fetch_changed_members() reads it with Range
+requests, compares it with the files of the installed version and fetches
+only the byte ranges of members that differ, writing everything at its
+original offset into a sparse local copy of the zip. zipfile opens that
+copy as usual as long as the holes are never read: stage_version() takes
+the unchanged members from the installed version instead.
+
+The installed files themselves serve as the manifest of the current
+version, so a file that was modified locally counts as changed.
+"""
+
+import zlib
+import struct
+import zipfile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request
+from urllib.error import URLError, HTTPError
+
+from .download import RemoteChangedError, copy_response, get_if_range, probe_range_support
+from .httppool import urlopen
+from .install import get_member_target
+
+
+# Bytes read from the end of the zip: the end of central directory record
+# with the longest possible comment, plus the zip64 locator before it
+TAIL_SIZE = 22 + 65535 + 20
+
+# Changed members closer together than this are fetched with one request
+MERGE_GAP = 256 * 1024
+
+
+def fetch_range(url, f, start, end, headers=None, if_range=None):
+    """
+    Write bytes [start, end] of url into f at the same offset.
+
+    Returns:
+        Number of bytes written
+    """
+    range_headers = dict(headers or {})
+    range_headers["Range"] = f"bytes={start}-{end}"
+    if if_range:
+        range_headers["If-Range"] = if_range
+    with urlopen(Request(url, headers=range_headers)) as response:
+        if response.status != 206:
+            raise RemoteChangedError(f"Server answered a range request with HTTP {response.status}")
+        f.seek(start)
+        written = copy_response(response, f, start, end - start + 1, lambda position, data: None)
+    if written != end - start + 1:
+        raise RemoteChangedError(f"Range {start}-{end} incomplete: got {written} bytes")
+    return written
+
+
+def find_central_directory(tail, tail_offset):
+    """
+    Locate the central directory from the last bytes of a zip.
+
+    Returns:
+        Tuple (offset, size) of the central directory, or None if the
+        end of central directory record isn't where it should be
+    """
+    eocd = tail.rfind(b"PK\x05\x06")
+    if eocd < 0 or len(tail) - eocd < 22:
+        return None
+    cd_size, cd_offset = struct.unpack("<LL", tail[eocd + 12:eocd + 20])
+    if cd_offset != 0xFFFFFFFF and cd_size != 0xFFFFFFFF:
+        return cd_offset, cd_size
+
+    # Zip64: the locator right before the record points at the zip64 record
+    locator = eocd - 20
+    if locator < 0 or tail[locator:locator + 4] != b"PK\x06\x07":
+        return None
+    (record_offset,) = struct.unpack("<Q", tail[locator + 8:locator + 16])
+    record = record_offset - tail_offset
+    if record < 0 or tail[record:record + 4] != b"PK\x06\x06":
+        return None
+    cd_size, cd_offset = struct.unpack("<QQ", tail[record + 40:record + 56])
+    return cd_offset, cd_size
+
+
+def get_zip_root(names):
+    """Get the single top-level directory stage_version() flattens away, or None"""
+    roots = set()
+    for name in names:
+        parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+        if len(parts) == 1 and not name.endswith("/"):
+            return None
+        if parts:
+            roots.add(parts[0])
+    return roots.pop() if len(roots) == 1 else None
+
+
+def file_crc32(path):
+    """CRC-32 of a file, as recorded in zip headers"""
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def merge_ranges(ranges, gap=MERGE_GAP):
+    """Merge [start, end] ranges that are at most gap bytes apart"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start - merged[-1][1] <= gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def fetch_changed_members(url, zip_path, current_dir, headers=None, expected_size=0, segments=4):
+    """
+    Build a sparse copy of a remote zip holding only what current_dir lacks.
+
+    Args:
+        url: Download URL of the zip
+        zip_path: Where to write the sparse copy
+        current_dir: Directory of the installed version
+        segments: Number of member ranges fetched at the same time
+
+    Returns:
+        Tuple (reuse, fetched bytes), where reuse maps the names of unchanged
+        members to their file in current_dir for stage_version(); None if
+        the server doesn't serve byte ranges or anything else went wrong,
+        in which case the caller downloads the whole zip
+    """
+    probe = probe_range_support(url, headers)
+    if probe is None:
+        print("Server doesn't serve byte ranges, downloading the full asset")
+        return None
+    final_url, total_size, validators = probe
+    if expected_size > 0 and total_size != expected_size:
+        print(f"Remote size {total_size} doesn't match the release asset, downloading the full asset")
+        return None
+    if_range = get_if_range(validators)
+
+    try:
+        # The end of central directory record, then the central directory itself
+        tail_start = max(0, total_size - TAIL_SIZE)
+        with open(zip_path, "w+b") as f:
+            f.truncate(total_size)
+            fetched = fetch_range(final_url, f, tail_start, total_size - 1, headers, if_range)
+            f.seek(tail_start)
+            located = find_central_directory(f.read(), tail_start)
+            if located is None:
+                print("No zip central directory found, downloading the full asset")
+                return None
+            cd_offset, cd_size = located
+            if cd_offset < tail_start:
+                fetched += fetch_range(final_url, f, cd_offset, tail_start - 1, headers, if_range)
+
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            infos = zip_ref.infolist()
+
+        # A member spans from its local header to the next header (or the central directory)
+        offsets = sorted({info.header_offset for info in infos} | {cd_offset})
+        next_offset = dict(zip(offsets, offsets[1:]))
+        root = get_zip_root([info.filename for info in infos])
+
+        reuse = {}
+        ranges = []
+        for info in infos:
+            if info.is_dir():
+                continue
+            relative = get_member_target(Path(), info.filename)
+            if relative is None:
+                # Unsafe names are refused by extract_zip() on the full download
+                return None
+            existing = current_dir.joinpath(*relative.parts[1 if root else 0:])
+            if (
+                existing.is_file()
+                and not existing.is_symlink()
+                and existing.stat().st_size == info.file_size
+                and file_crc32(existing) == info.CRC
+            ):
+                reuse[info.filename] = existing
+            elif info.header_offset < tail_start:
+                ranges.append((info.header_offset, min(next_offset[info.header_offset], tail_start) - 1))
+
+        def fetch_merged(merged_range):
+            with open(zip_path, "r+b", buffering=0) as f:
+                return fetch_range(final_url, f, merged_range[0], merged_range[1], headers, if_range)
+
+        merged = merge_ranges(ranges)
+        if merged:
+            with ThreadPoolExecutor(max_workers=max(1, min(segments, len(merged)))) as executor:
+                fetched += sum(executor.map(fetch_merged, merged))
+    except (RemoteChangedError, HTTPError, URLError, OSError, zipfile.BadZipFile) as e:
+        print(f"Incremental fetch failed ({e}), downloading the full asset")
+        return None
+
+    members = sum(1 for info in infos if not info.is_dir())
+    print(
+        f"Fetched {fetched / 1024 / 1024:.2f} MB of {total_size / 1024 / 1024:.2f} MB: "
+        f"{members - len(reuse)} of {members} members changed"
+    )
+    return reuse, fetched
@@ -0,0 +1,121 @@
+"""
+Mirroring the 52pojie files that match a pattern into a local directory
+
+A synced directory holds SYNC_STATE_NAME, recording the size and time
+list.js showed for every file that was downloaded into it. A file whose
+listing still shows the same size and time (and whose local copy still has
+that size) is skipped; pruning only ever deletes files recorded there, so
+anything else in the directory is left alone.
+"""
+
+import os
+import json
+import threading
+
+from .install import get_member_target
+from .pojie import DOWNLOAD_BASE_URL, compile_pattern
+
+
+SYNC_STATE_NAME = ".dl-tools-sync.json"
+
+# Number of files downloaded at the same time
+DEFAULT_SYNC_WORKERS = 4
+
+
+def get_sync_path(target_dir, file_url, pattern):
+    """
+    Get the local path of a matched file.
+
+    The pattern's leading literal directories are left out, so
+    "/Tools/Android_Tools/**/.*\\.apk" mirrors /Tools/Android_Tools/a/b.apk
+    to <target_dir>/a/b.apk.
+
+    Returns:
+        Path inside target_dir, or None if the remote name would escape it
+    """
+    steps = compile_pattern(pattern)
+    skip = 0
+    for kind, _ in steps[:-1]:
+        if kind != "literal":
+            break
+        skip += 1
+    segments = file_url[len(DOWNLOAD_BASE_URL):].strip("/").split("/")
+    return get_member_target(target_dir, "/".join(segments[skip:]))
+
+
+class SyncState:
+    """The SYNC_STATE_NAME file of a target directory, safe to update from worker threads"""
+
+    def __init__(self, target_dir):
+        self.path = target_dir / SYNC_STATE_NAME
+        self.lock = threading.Lock()
+        try:
+            self.files = json.loads(self.path.read_text()).get("files", {})
+        except (OSError, ValueError, AttributeError):
+            self.files = {}
+
+    def is_current(self, relative_path, local_path, file_size, modified_time):
+        """Check whether local_path is the listed version of the file"""
+        with self.lock:
+            entry = self.files.get(relative_path)
+        if entry != {"size": file_size, "time": modified_time}:
+            return False
+        try:
+            return local_path.stat().st_size == file_size
+        except OSError:
+            return False
+
+    def record(self, relative_path, file_size, modified_time):
+        with self.lock:
+            self.files[relative_path] = {"size": file_size, "time": modified_time}
+
+    def forget(self, relative_path):
+        with self.lock:
+            self.files.pop(relative_path, None)
+
+    def save(self):
+        with self.lock:
+            data = json.dumps({"files": self.files}, indent=1, sort_keys=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Warning: Could not save sync state: {e}")
+
+
+def prune_synced_files(target_dir, state, listed):
+    """
+    Delete synced files that are no longer listed, and directories they leave empty.
+
+    Args:
+        listed: Set of relative paths that are still listed
+
+    Returns:
+        Number of files deleted
+    """
+    pruned = 0
+    for relative_path in sorted(set(state.files) - listed):
+        local_path = get_member_target(target_dir, relative_path)
+        state.forget(relative_path)
+        if local_path is None:
+            continue
+        try:
+            local_path.unlink()
+            print(f"Pruned {relative_path}")
+            pruned += 1
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            print(f"Warning: Could not prune {relative_path}: {e}")
+            continue
+
+        parent = local_path.parent
+        while parent != target_dir:
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+            parent = parent.parent
+    return pruned
@@ -0,0 +1,160 @@
+"""
+Keeping an update out of the way of the real workloads on a box
+
+set_rate_limit() caps the bandwidth of a whole run: every response body
+read through dltools.httppool draws from one token bucket, so all the
+segments, mirror chunks and tools of a run downloading in parallel share
+the limit instead of each getting it. run_at_low_priority() runs a phase
+(verifying, extracting) in a thread at the lowest CPU and idle IO
+priority, so it only gets what the other processes leave over.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import threading
+import subprocess
+import contextvars
+
+
+# Nice value of low priority work; 19 is the lowest CPU priority
+LOW_PRIORITY_NICE = 19
+
+# The bucket holds this many seconds worth of bytes, so a run can't burst far above the limit
+BURST_SECONDS = 0.25
+MIN_BURST = 16 * 1024
+
+RATE_UNITS = {"": 1, "K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
+
+
+class TokenBucket:
+    """
+    Hands out bytes at a steady rate to any number of threads.
+
+    A thread takes what it has just read and sleeps off the deficit, so
+    the bucket can go into debt and readers queue up behind each other;
+    over any longer span the threads together get `rate` bytes a second.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.burst = max(MIN_BURST, int(rate * BURST_SECONDS))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        """Take amount bytes from the bucket, sleeping until they're paid for"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            delay = -self.tokens / self.rate
+        if delay > 0:
+            time.sleep(delay)
+
+
+_bucket = None
+
+
+def parse_rate(value):
+    """
+    Parse a --limit-rate value: bytes per second, optionally with a K, M or G suffix (binary units).
+
+    Raises:
+        argparse.ArgumentTypeError
+    """
+    text = value.strip().upper()
+    if text.endswith("B"):
+        text = text[:-1]
+    unit = text[-1:] if text[-1:] in RATE_UNITS else ""
+    try:
+        rate = float(text[: len(text) - len(unit)]) * RATE_UNITS[unit]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid rate: {value!r} (e.g. 500K or 2M)")
+    if rate <= 0:
+        raise argparse.ArgumentTypeError(f"rate must be positive: {value!r}")
+    return int(rate)
+
+
+def set_rate_limit(rate):
+    """Limit the bandwidth of the whole run to rate bytes/s; None or 0 lifts the limit"""
+    global _bucket
+    _bucket = TokenBucket(rate) if rate else None
+
+
+def get_rate_limit():
+    """The bandwidth limit of the run in bytes/s, or None"""
+    return _bucket.rate if _bucket is not None else None
+
+
+def get_read_size(size):
+    """Shrink a read to the burst of the rate limit, so the streams take turns in small steps"""
+    if _bucket is None or size is None or size < 0:
+        return size
+    return min(size, _bucket.burst)
+
+
+def throttle(amount):
+    """Account for amount bytes just read, waiting if the run is over its rate limit"""
+    if _bucket is not None and amount:
+        _bucket.consume(amount)
+
+
+def lower_priority():
+    """
+    Run the calling thread, and the threads it starts, at idle CPU and IO priority.
+
+    On Linux both are properties of the thread and are inherited by the
+    threads it starts; elsewhere the nice value of the whole process
+    changes. The IO class is set with ionice(1) where available.
+    """
+    try:
+        os.nice(LOW_PRIORITY_NICE)
+    except (AttributeError, OSError) as e:
+        print(f"Warning: Could not lower the CPU priority: {e}")
+
+    if sys.platform.startswith("linux") and shutil.which("ionice"):
+        result = subprocess.run(
+            ["ionice", "-c", "3", "-p", str(threading.get_native_id())],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        if result.returncode != 0:
+            print("Warning: Could not lower the IO priority")
+
+
+def run_at_low_priority(func, *args, **kwargs):
+    """
+    Call func in a new thread at idle CPU and IO priority and wait for it.
+
+    An unprivileged process can't raise its priority again once lowered,
+    so the work moves to a thread of its own instead. It keeps the
+    context of the caller, i.e. its output prefix and profile spans.
+
+    Returns:
+        What func returns; exceptions are raised in the caller
+    """
+    context = contextvars.copy_context()
+    outcome = {}
+
+    def work():
+        lower_priority()
+        return func(*args, **kwargs)
+
+    def run():
+        try:
+            outcome["result"] = context.run(work)
+        except BaseException as e:
+            outcome["error"] = e
+
+    # A daemon thread doesn't keep an interrupted run alive
+    thread = threading.Thread(target=run, name=f"low-priority-{func.__name__}", daemon=True)
+    thread.start()
+    thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
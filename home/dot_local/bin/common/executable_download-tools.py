@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Download and install every tool listed in the dl-tools manifest, in parallel
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+# The shared engine lives next to this script (dl-tools is a symlink to it)
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from dltools.cache import DEFAULT_CACHE_MAX_SIZE, print_cache_stats
+from dltools.download import set_progress_enabled
+from dltools.engine import DEFAULT_CONCURRENCY, get_manifest_path, load_manifest, run_tools
+from dltools.events import configure_events, print_profile
+from dltools.install import DEFAULT_KEEP_VERSIONS
+from dltools.locks import DEFAULT_LOCK_TIMEOUT
+from dltools.peers import DEFAULT_SERVE_PORT, serve_cache
+from dltools.prefetch import PREFETCH_TYPES, wait_jitter
+from dltools.throttle import lower_priority, parse_rate, set_rate_limit
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Download and install the tools listed in a manifest, in parallel",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+
+    parser.add_argument(
+        "tools",
+        nargs="*",
+        help="Names of the manifest entries to install (default: all)",
+    )
+
+    parser.add_argument(
+        "-m",
+        "--manifest",
+        type=str,
+        default=None,
+        help=f"Manifest file (default: {get_manifest_path()})",
+    )
+
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Number of tools resolved or installed at the same time (default: {DEFAULT_CONCURRENCY})",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of threads used to extract each zip (default: CPU count)",
+    )
+
+    parser.add_argument(
+        "-r",
+        "--retries",
+        type=int,
+        default=3,
+        help="Number of times a failed download is retried, continuing the partial file (default: 3)",
+    )
+
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="When upgrading, fetch only the zip members that differ from the installed version of each github tool using byte ranges "
+        "(member CRC-32s are checked, the asset's SHA-256 can't be)",
+    )
+
+    parser.add_argument(
+        "--mirror",
+        dest="mirrors",
+        action="append",
+        default=None,
+        metavar="URL",
+        help="Another source of each github tool's release asset; may be given more than once. The fastest of these and the original URL is used, "
+        "with stalled chunks hedged on the next one. A URL may use {url}, {path} and {name}, otherwise the asset's path is appended "
+        "(only used for assets with a SHA-256 digest to check the result against)",
+    )
+
+    parser.add_argument(
+        "--peer",
+        dest="peers",
+        action="append",
+        default=None,
+        metavar="URL",
+        help="Host running dl-tools --serve-cache to fetch artifacts from before the origin; may be given more than once. "
+        "The size and SHA-256 are checked against the origin's metadata as usual (github assets without a SHA-256 digest aren't fetched from peers, 52pojie files are only checked by size)",
+    )
+
+    parser.add_argument(
+        "--limit-rate",
+        type=parse_rate,
+        default=None,
+        metavar="RATE",
+        help="Cap the bandwidth of the whole run, shared by all parallel connections, in bytes/s; K, M and G suffixes are accepted (e.g. 2M)",
+    )
+
+    parser.add_argument(
+        "--low-priority",
+        action="store_true",
+        help="Verify and extract at idle CPU/IO priority, so installs yield to other work on the machine",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't read from or write to the local artifact and metadata caches",
+    )
+
+    parser.add_argument(
+        "--no-index",
+        action="store_true",
+        help="Parse 52pojie's list.js on every run instead of querying the on-disk path index",
+    )
+
+    parser.add_argument(
+        "--metadata-ttl",
+        type=int,
+        default=0,
+        help="Reuse cached metadata younger than this many seconds without asking the server (default: 0, always revalidate)",
+    )
+
+    parser.add_argument(
+        "--cache-max-size",
+        type=int,
+        default=DEFAULT_CACHE_MAX_SIZE,
+        help=f"Size cap of the artifact cache in MB, least recently used entries are evicted (default: {DEFAULT_CACHE_MAX_SIZE})",
+    )
+
+    parser.add_argument(
+        "--keep",
+        type=int,
+        default=DEFAULT_KEEP_VERSIONS,
+        help=f"Number of versions of each github tool kept in its store (default: {DEFAULT_KEEP_VERSIONS})",
+    )
+
+    parser.add_argument(
+        "--lock-timeout",
+        type=int,
+        default=DEFAULT_LOCK_TIMEOUT,
+        help=f"Seconds to wait for another run that is installing to the same path or downloading the same file (default: {DEFAULT_LOCK_TIMEOUT})",
+    )
+
+    parser.add_argument(
+        "--prefetch",
+        action="store_true",
+        help="Only download and verify new releases into the artifact cache, at idle CPU/IO priority, "
+        "so a later install just extracts them (for a timer or cron job)",
+    )
+
+    parser.add_argument(
+        "--jitter",
+        type=int,
+        default=0,
+        help="Wait a random number of seconds up to this before starting, to spread out scheduled runs (default: 0)",
+    )
+
+    parser.add_argument(
+        "--serve-cache",
+        nargs="?",
+        const=str(DEFAULT_SERVE_PORT),
+        default=None,
+        metavar="[HOST:]PORT",
+        help="Serve the verified artifacts and cached metadata of this host to --peer runs on other hosts until interrupted "
+        f"(default port: {DEFAULT_SERVE_PORT}, all interfaces)",
+    )
+
+    parser.add_argument(
+        "--events-json",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="Append a JSON line per timed phase (wall/CPU time, bytes, throughput) to PATH, '-' for stdout",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print a table of the timed phases at the end",
+    )
+
+    parser.add_argument(
+        "--cache-stats",
+        action="store_true",
+        help="Print artifact cache usage and hit/miss counters, then exit",
+    )
+
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    # Parse command line arguments
+    args = parse_arguments()
+
+    if args.cache_stats:
+        print_cache_stats()
+        return
+
+    if args.serve_cache:
+        serve_cache(args.serve_cache)
+        return
+
+    manifest_path = Path(args.manifest) if args.manifest else get_manifest_path()
+    tools = load_manifest(manifest_path)
+    if tools is None:
+        sys.exit(1)
+
+    if args.tools:
+        unknown = set(args.tools) - {tool["name"] for tool in tools}
+        if unknown:
+            print(f"Error: Not in {manifest_path}: {', '.join(sorted(unknown))}")
+            sys.exit(1)
+        tools = [tool for tool in tools if tool["name"] in args.tools]
+
+    if not tools:
+        print(f"No tools listed in {manifest_path}")
+        return
+
+    configure_events(args.events_json)
+    set_rate_limit(args.limit_rate)
+    wait_jitter(args.jitter)
+    if args.prefetch:
+        # Before run_tools() starts any thread, so they all inherit the priority
+        lower_priority()
+        set_progress_enabled(sys.stdout.isatty())
+        print(f"Prefetching {len(tools)} tool(s) from {manifest_path}: {', '.join(t['name'] for t in tools)}")
+        results = run_tools(tools, args, args.concurrency, PREFETCH_TYPES)
+    else:
+        print(f"Installing {len(tools)} tool(s) from {manifest_path}: {', '.join(t['name'] for t in tools)}")
+        results = run_tools(tools, args, args.concurrency)
+
+    print("\nSummary:")
+    for tool in tools:
+        status = "✓" if results.get(tool["name"]) else "✗"
+        print(f"  {status} {tool['name']}")
+    if args.profile:
+        print_profile()
+
+    if not all(results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        # An interrupted download has reported the partial file it kept
+        sys.exit(1)
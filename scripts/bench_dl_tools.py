@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of download-jadx.py and download-jeb.py
+
+Starts a local HTTP server that stands in for api.github.com (release info
+with size/digest, the 302 to the asset storage host, byte ranges) and for
+down.52pojie.cn (compressed list.js JSONP, file downloads), runs the download
+scripts end to end against it and reports per-phase throughput from their
+--events-json output.
+
+Usage:
+    python3 scripts/bench_dl_tools.py --jadx-size 120 --latency 40 --bandwidth 20
+    python3 scripts/bench_dl_tools.py --connect-latency 100 --scenarios jadx-warm
+    python3 scripts/bench_dl_tools.py --list-encoding deflate --scenarios jeb-cold
+    python3 scripts/bench_dl_tools.py --scenarios list-parse --tree-nodes 216000
+    python3 scripts/bench_dl_tools.py --json before.json
+    python3 scripts/bench_dl_tools.py --compare before.json
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import gzip
+import zlib
+import time
+import random
+import shutil
+import hashlib
+import zipfile
+import argparse
+import statistics
+import subprocess
+import tempfile
+import threading
+import tracemalloc
+from pathlib import Path
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "home" / "dot_local" / "bin" / "common"
+JADX_VERSION = "v1.5.3"
+JEB_VERSION = "5.30"
+
+# Content codings the stand-in can serve list.js in
+LIST_ENCODERS = {
+    "identity": lambda data: data,
+    "gzip": lambda data: gzip.compress(data, 6),
+    "deflate": lambda data: zlib.compress(data, 6),
+}
+try:
+    from compression import zstd
+    LIST_ENCODERS["zstd"] = zstd.compress
+except ImportError:
+    try:
+        import zstandard
+        LIST_ENCODERS["zstd"] = zstandard.ZstdCompressor().compress
+    except ImportError:
+        pass
+try:
+    import brotli
+    LIST_ENCODERS["br"] = brotli.compress
+except ImportError:
+    pass
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the download tools against a local stand-in for GitHub and 52pojie",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+
+    parser.add_argument("--jadx-size", type=float, default=60, help="Uncompressed size of the synthetic jadx zip in MB (default: 60)")
+    parser.add_argument("--jadx-files", type=int, default=40, help="Number of jars in the synthetic jadx zip (default: 40)")
+    parser.add_argument("--jeb-size", type=float, default=40, help="Size of the synthetic JEB file in MB (default: 40)")
+    parser.add_argument("--tree-nodes", type=int, default=200000, help="Number of entries in the synthetic list.js (default: 200000)")
+    parser.add_argument("--list-encoding", choices=sorted(LIST_ENCODERS), default="gzip", help="Content-Encoding of list.js when the client accepts it, identity otherwise (default: gzip)")
+    parser.add_argument("--latency", type=float, default=0, help="Delay before every response in ms (default: 0)")
+    parser.add_argument("--connect-latency", type=float, default=0, help="Delay when a connection is opened, standing in for the TCP/TLS handshake, in ms (default: 0)")
+    parser.add_argument("--bandwidth", type=float, default=0, help="Per-connection bandwidth cap in MB/s, 0 for none (default: 0)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; medians are reported (default: 3)")
+    parser.add_argument("--scenarios", type=str, default="jadx-cold,jadx-warm,jeb-cold,jeb-warm,list-parse", help="Comma-separated scenarios to run; list-parse times the list.js parsers in-process")
+    parser.add_argument("--extra-args", type=str, default="", help="Extra arguments passed to every script run, e.g. '-s 8'")
+    parser.add_argument("--json", type=str, default=None, metavar="PATH", help="Write the results to PATH")
+    parser.add_argument("--compare", type=str, default=None, metavar="PATH", help="Compare with results written earlier by --json")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory for inspection")
+
+    return parser.parse_args()
+
+
+def random_bytes(rng, size):
+    """Incompressible filler"""
+    return rng.getrandbits(size * 8).to_bytes(size, "little") if size else b""
+
+
+def make_jadx_zip(version, total_size, file_count):
+    """
+    Build a zip laid out like the jadx release: launchers in bin/, jars in lib/.
+
+    Half of every jar is random (already compressed class data), half is
+    repetitive text, so both inflate and plain copying show up in the timings.
+    """
+    rng = random.Random(1)
+    jar_size = max(1, total_size // file_count)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name in ("bin/jadx", "bin/jadx-gui"):
+            info = zipfile.ZipInfo(name)
+            info.external_attr = 0o100755 << 16
+            zf.writestr(info, f"#!/bin/sh\necho {name} {version}\n")
+        for index in range(file_count):
+            text = (f"com/example/pkg{index}/Class.class " * (jar_size // 64 + 1)).encode()
+            data = random_bytes(rng, jar_size // 2) + text[: jar_size - jar_size // 2]
+            info = zipfile.ZipInfo(f"lib/jadx-lib-{index}.jar")
+            info.external_attr = 0o100644 << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+            zf.writestr(info, data)
+    return buffer.getvalue()
+
+
+def make_list_js(node_count, jeb_name, jeb_size):
+    """Build the list.js JSONP body with node_count entries around the JEB demos"""
+    rng = random.Random(2)
+    android_tools = [
+        {"name": f"JEB_demo_5.{minor}_by_CXV.zip", "size": 1024 * minor, "time": 1600000000 + minor}
+        for minor in range(10, 30)
+    ]
+    android_tools.append({"name": jeb_name, "size": jeb_size, "time": 1700000000})
+
+    categories = []
+    remaining = node_count - len(android_tools)
+    per_dir = 500
+    for index in range(max(1, remaining // per_dir)):
+        categories.append({
+            "name": f"Category_{index}",
+            "children": [
+                {"name": f"tool_{index}_{n}.zip", "size": rng.randint(1, 1 << 30), "time": 1500000000 + n}
+                for n in range(per_dir)
+            ],
+        })
+
+    tree = {"name": "", "children": [{"name": "Tools", "children": categories + [
+        {"name": "Android_Tools", "children": android_tools},
+    ]}]}
+    body = "__jsonpCallbackDown52PojieCn(" + json.dumps(tree, separators=(",", ":")) + ");"
+    return body.encode("utf-8")
+
+
+class StandIn:
+    """The documents and files the stand-in server hands out"""
+
+    def __init__(self, args):
+        print("Generating synthetic data...")
+        self.jadx_name = f"jadx-{JADX_VERSION.lstrip('v')}.zip"
+        self.jadx_zip = make_jadx_zip(JADX_VERSION, int(args.jadx_size * 1024 * 1024), args.jadx_files)
+        self.jeb_name = f"JEB_demo_{JEB_VERSION}_by_CXV.zip"
+        self.jeb_file = random_bytes(random.Random(3), int(args.jeb_size * 1024 * 1024))
+        list_js = make_list_js(args.tree_nodes, self.jeb_name, len(self.jeb_file))
+        self.list_encoding = args.list_encoding
+        self.list_js = {
+            coding: LIST_ENCODERS[coding](list_js) for coding in {"identity", args.list_encoding}
+        }
+        self.latency = args.latency / 1000
+        self.connect_latency = args.connect_latency / 1000
+        self.bandwidth = args.bandwidth * 1024 * 1024
+        self.last_modified = formatdate(time.time() - 86400, usegmt=True)
+        self.requests = {}
+        self.lock = threading.Lock()
+        print(
+            f"  jadx zip: {len(self.jadx_zip) / 1024 / 1024:.2f} MB, "
+            f"JEB: {len(self.jeb_file) / 1024 / 1024:.2f} MB, "
+            f"list.js: {len(self.list_js[self.list_encoding]) / 1024 / 1024:.2f} MB {self.list_encoding}"
+        )
+
+    def release_info(self, base_url):
+        assets = []
+        for name in (f"jadx-gui-{JADX_VERSION.lstrip('v')}-with-jre-win.zip", self.jadx_name):
+            data = self.jadx_zip if name == self.jadx_name else b""
+            assets.append({
+                "name": name,
+                "size": len(data),
+                "digest": "sha256:" + hashlib.sha256(data).hexdigest(),
+                "browser_download_url": f"{base_url}/skylot/jadx/releases/download/{JADX_VERSION}/{name}",
+            })
+        return json.dumps({"tag_name": JADX_VERSION, "assets": assets}).encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    stand_in = None
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.count("connections")
+        if self.stand_in.connect_latency:
+            time.sleep(self.stand_in.connect_latency)
+
+    def count(self, kind):
+        with self.stand_in.lock:
+            self.stand_in.requests[kind] = self.stand_in.requests.get(kind, 0) + 1
+
+    def send_empty(self, status, headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def send_document(self, data, content_type, extra_headers=None, ranges=False):
+        """Send data with ETag/Last-Modified, honouring conditional and Range requests"""
+        etag = '"' + hashlib.md5(data).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            return self.send_empty(304, {"ETag": etag})
+
+        status, start, end = 200, 0, len(data) - 1
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if ranges and range_header and if_range in (None, etag, self.stand_in.last_modified):
+            match = re.match(r"bytes=(\d+)-(\d*)$", range_header)
+            if match:
+                start = int(match.group(1))
+                end = min(int(match.group(2)) if match.group(2) else end, len(data) - 1)
+                if start > end:
+                    return self.send_empty(416, {"Content-Range": f"bytes */{len(data)}"})
+                status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", self.stand_in.last_modified)
+        if ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.write_throttled(memoryview(data)[start:end + 1])
+
+    def write_throttled(self, view):
+        chunk_size = 64 * 1024
+        bandwidth = self.stand_in.bandwidth
+        started = time.monotonic()
+        for offset in range(0, len(view), chunk_size):
+            try:
+                self.wfile.write(view[offset:offset + chunk_size])
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            if bandwidth:
+                # Sleep until the bytes sent so far fit the bandwidth budget
+                delay = (offset + chunk_size) / bandwidth - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+    def do_GET(self):
+        if self.stand_in.latency:
+            time.sleep(self.stand_in.latency)
+
+        path = self.path.split("?")[0]
+        base_url = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+        stand_in = self.stand_in
+
+        if path == "/repos/skylot/jadx/releases/latest":
+            self.count("release_info")
+            return self.send_document(stand_in.release_info(base_url), "application/json")
+
+        if path.startswith("/skylot/jadx/releases/download/"):
+            # GitHub redirects release downloads to its storage host
+            self.count("asset_redirect")
+            name = path.rsplit("/", 1)[-1]
+            location = f"{base_url}/release-assets/{name}?sig={random.getrandbits(64):x}"
+            return self.send_empty(302, {"Location": location})
+
+        if path.startswith("/release-assets/"):
+            self.count("asset")
+            if path.endswith("/" + stand_in.jadx_name):
+                return self.send_document(stand_in.jadx_zip, "application/octet-stream", ranges=True)
+
+        if path == "/list.js":
+            self.count("list_js")
+            accepted = [coding.split(";")[0].strip() for coding in self.headers.get("Accept-Encoding", "").split(",")]
+            coding = stand_in.list_encoding if stand_in.list_encoding in accepted else "identity"
+            headers = {"Vary": "Accept-Encoding"}
+            if coding != "identity":
+                headers["Content-Encoding"] = coding
+            return self.send_document(stand_in.list_js[coding], "application/javascript", headers)
+
+        if path == f"/Tools/Android_Tools/{stand_in.jeb_name}":
+            self.count("jeb_file")
+            return self.send_document(stand_in.jeb_file, "application/zip", ranges=True)
+
+        self.count("not_found")
+        self.send_empty(404)
+
+
+def start_server(stand_in):
+    """Start the stand-in server on a free local port"""
+    Handler.stand_in = stand_in
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def run_script(script, script_args, base_url, scratch, cache_dir, events_path):
+    """
+    Run one download script against the stand-in.
+
+    Returns:
+        Tuple (wall seconds of the whole process, list of span events)
+    """
+    env = dict(os.environ)
+    env.pop("GITHUB_TOKEN", None)
+    env.update({
+        "DL_TOOLS_GITHUB_API": base_url,
+        "DL_TOOLS_52POJIE_URL": base_url,
+        "XDG_CACHE_HOME": str(cache_dir),
+        "TMPDIR": str(scratch / "tmp"),
+    })
+    (scratch / "tmp").mkdir(exist_ok=True)
+    if events_path.exists():
+        events_path.unlink()
+
+    command = [sys.executable, str(SCRIPTS_DIR / script)] + script_args + ["--events-json", str(events_path)]
+    started = time.perf_counter()
+    result = subprocess.run(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        print(result.stdout.decode("utf-8", "replace")[-3000:])
+        raise RuntimeError(f"{script} exited with {result.returncode}")
+
+    events = [json.loads(line) for line in events_path.read_text().splitlines() if line.strip()]
+    return wall, events
+
+
+def run_scenario(name, args, base_url, scratch):
+    """
+    Run a scenario args.repeat times.
+
+    "cold" starts from an empty cache; "warm" runs once to fill the cache
+    and then measures runs that can use it. Every run installs into a fresh
+    directory.
+
+    Returns:
+        List of (process wall seconds, span events) per run
+    """
+    tool, temperature = name.split("-")
+    extra_args = args.extra_args.split()
+    cache_dir = scratch / f"cache-{name}"
+    events_path = scratch / "events.jsonl"
+    runs = []
+
+    for attempt in range(args.repeat + (1 if temperature == "warm" else 0)):
+        if temperature == "cold" and cache_dir.exists():
+            shutil.rmtree(cache_dir)
+        target = scratch / f"{name}-{attempt}"
+        if tool == "jadx":
+            script, script_args = "executable_download-jadx.py", [str(target)] + extra_args
+        else:
+            script, script_args = "executable_download-jeb.py", [str(target)] + extra_args
+
+        wall, events = run_script(script, script_args, base_url, scratch, cache_dir, events_path)
+        shutil.rmtree(target, ignore_errors=True)
+        shutil.rmtree(target.parent / f".{target.name}.store", ignore_errors=True)
+        if temperature == "warm" and attempt == 0:
+            continue
+        runs.append((wall, events))
+    return runs
+
+
+def run_parse_scenario(args, stand_in):
+    """
+    Time the list.js parsers in-process, args.repeat times.
+
+    json_loads is what get_file_list did before streaming: inflate, decode
+    and json.loads the whole body. stream_all is iter_tree_nodes over every
+    node, as an index rebuild does, and stream_prefix only walks the JEB
+    demos' directory, as --no-index does. Peak memory is traced in a
+    separate pass, since tracemalloc slows the parsers down.
+
+    Returns:
+        List of (wall seconds, span events) per run, like run_scenario
+    """
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    from dltools.decoders import decode_chunks
+    from dltools.pojie import iter_tree_nodes
+
+    coding = stand_in.list_encoding
+    body = stand_in.list_js[coding]
+    size = len(stand_in.list_js["identity"]) if "identity" in stand_in.list_js else len(body)
+    content_encoding = None if coding == "identity" else coding
+
+    def json_loads():
+        text = b"".join(decode_chunks(iter([body]), content_encoding)).decode("utf-8")
+        return len(json.loads(text[text.index("(") + 1:text.rindex(")")])["children"])
+
+    def stream(prefix=None):
+        return sum(1 for _ in iter_tree_nodes(io.BytesIO(body), prefix, content_encoding))
+
+    parsers = {
+        "json_loads": json_loads,
+        "stream_all": stream,
+        "stream_prefix": lambda: stream(["Tools", "Android_Tools", "JEB_demo_"]),
+    }
+    runs = []
+    for _ in range(args.repeat):
+        events = []
+        started = time.perf_counter()
+        for phase, parse in parsers.items():
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            parse()
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+
+            tracemalloc.start()
+            try:
+                parse()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            events.append({"event": "span", "phase": phase, "wall_s": wall, "cpu_s": cpu, "bytes": size, "peak_bytes": peak})
+        runs.append((time.perf_counter() - started, events))
+    return runs
+
+
+def summarize(runs):
+    """Reduce the runs of a scenario to median figures per phase"""
+    phases = {}
+    for _, events in runs:
+        for event in events:
+            if event.get("event") != "span":
+                continue
+            entry = phases.setdefault(event["phase"], {"wall_s": [], "cpu_s": [], "bytes": [], "peak_bytes": []})
+            entry["wall_s"].append(event["wall_s"])
+            entry["cpu_s"].append(event["cpu_s"])
+            entry["bytes"].append(event["bytes"])
+            if "peak_bytes" in event:
+                entry["peak_bytes"].append(event["peak_bytes"])
+
+    summary = {"process_wall_s": statistics.median(wall for wall, _ in runs), "phases": {}}
+    for phase, entry in phases.items():
+        wall = statistics.median(entry["wall_s"])
+        size = statistics.median(entry["bytes"])
+        summary["phases"][phase] = {
+            "wall_s": round(wall, 6),
+            "cpu_s": round(statistics.median(entry["cpu_s"]), 6),
+            "bytes": size,
+            "mb_per_s": round(size / wall / 1024 / 1024, 3) if wall > 0 and size else None,
+        }
+        if entry["peak_bytes"]:
+            summary["phases"][phase]["peak_bytes"] = statistics.median(entry["peak_bytes"])
+    return summary
+
+
+def print_results(results, baseline=None):
+    """Print the median figures of every scenario, with the change against a baseline"""
+    for scenario, summary in results.items():
+        base = (baseline or {}).get(scenario)
+        print(f"\n{scenario}: {summary['process_wall_s']:.3f}s per run{format_delta(summary['process_wall_s'], base and base['process_wall_s'])}")
+        print(f"  {'phase':<14} {'wall s':>9} {'cpu s':>9} {'MB':>9} {'MB/s':>9}")
+        for phase, entry in summary["phases"].items():
+            base_entry = base and base["phases"].get(phase)
+            peak = f"  peak {entry['peak_bytes'] / 1024 / 1024:.1f} MB" if "peak_bytes" in entry else ""
+            print(
+                f"  {phase:<14} {entry['wall_s']:>9.3f} {entry['cpu_s']:>9.3f}"
+                f" {entry['bytes'] / 1024 / 1024:>9.2f} {entry['mb_per_s'] or 0:>9.1f}"
+                f"{peak}{format_delta(entry['wall_s'], base_entry and base_entry['wall_s'])}"
+            )
+
+
+def format_delta(value, baseline):
+    if not baseline:
+        return ""
+    return f"  ({(value - baseline) / baseline * 100:+.1f}% wall)"
+
+
+def main():
+    args = parse_arguments()
+
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())["results"]
+
+    stand_in = StandIn(args)
+    server, base_url = start_server(stand_in)
+    scratch = Path(tempfile.mkdtemp(prefix="dl-tools-bench-"))
+    print(f"Stand-in server: {base_url}, scratch directory: {scratch}")
+
+    results = {}
+    try:
+        for scenario in [name.strip() for name in args.scenarios.split(",") if name.strip()]:
+            print(f"Running {scenario} x{args.repeat}...")
+            if scenario == "list-parse":
+                results[scenario] = summarize(run_parse_scenario(args, stand_in))
+            else:
+                results[scenario] = summarize(run_scenario(scenario, args, base_url, scratch))
+    finally:
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    print_results(results, baseline)
+    print(f"\nRequests served: {json.dumps(stand_in.requests, sort_keys=True)}")
+
+    if args.json:
+        params = {key: value for key, value in vars(args).items() if key not in ("json", "compare", "keep")}
+        Path(args.json).write_text(json.dumps({"params": params, "results": results}, indent=2))
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()